@@ -0,0 +1,157 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import generar_casos
+import parse_dgii
+
+# Mide parse_dgii.py sobre casos sinteticos (o archivos dados) usando --stats.
+# Cada caso corre en un proceso aparte para que el pico de memoria sea el de
+# esa corrida.
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def medir(archivo: str, parse_args: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        sys.argv = ["parse_dgii.py", archivo, *parse_args, "--stats-json", "stats.json"]
+
+        salida = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(salida):
+            parse_dgii.main()
+        wall = time.perf_counter() - start
+
+        with open("stats.json", encoding="utf-8") as f:
+            stats = json.load(f)
+
+    tablas = stats["tablas"].values()
+
+    return {
+        "archivo": Path(archivo).name,
+        "args": " ".join(parse_args),
+        "wall": wall,
+        "filas": salida.getvalue().count("Generating ("),
+        "registros": sum(tabla["registros"] for tabla in tablas),
+        "sentencias": sum(tabla["sentencias"] for tabla in tablas),
+        "bytes": sum(tabla["bytes"] for tabla in tablas),
+        "peak_rss_mb": peak_rss_mb(),
+        # Tiempo inclusivo por etapa, con --jobs sumado entre los procesos
+        "secciones": {
+            name: etapa["segundos"]
+            for name, etapa in sorted(
+                stats["etapas"].items(), key=lambda item: -item[1]["segundos"]
+            )
+        },
+        "tablas": stats["tablas"],
+    }
+
+
+def correr(archivo: str, parse_args: list[str]) -> dict:
+    proceso = subprocess.run(
+        [sys.executable, __file__, "--medir", archivo, json.dumps(parse_args)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    )
+
+    return json.loads(proceso.stdout.splitlines()[-1])
+
+
+def imprimir(resultado: dict) -> None:
+    wall = resultado["wall"]
+    rss = resultado["peak_rss_mb"]
+
+    print(f"\n{resultado['archivo']} {resultado['args']}".rstrip())
+    print(f"  tiempo        {wall:10.3f} s")
+    print(f"  filas/s       {resultado['filas'] / wall:10.1f}")
+    print(f"  registros/s   {resultado['registros'] / wall:10.1f}")
+    print(f"  sentencias/s  {resultado['sentencias'] / wall:10.1f}")
+    print(f"  MB/s          {resultado['bytes'] / (1 << 20) / wall:10.2f}")
+    print(f"  pico RSS      {rss:10.1f} MB" if rss is not None else "  pico RSS   n/d")
+
+    for name, segundos in resultado["secciones"].items():
+        print(f"    {name:<45}{segundos:8.3f} s {segundos / wall:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Benchmark parse_dgii",
+        description="Mide filas/s, sentencias/s, pico de memoria y tiempo por "
+        "seccion de parse_dgii.py. Sin archivos genera casos sinteticos.",
+    )
+
+    parser.add_argument("archivos", nargs="*", help="Archivos .csv o .xlsx a medir")
+    parser.add_argument("-n", "--filas", type=int, default=500)
+    parser.add_argument("--lineas", type=generar_casos.rango, default=(1, 8))
+    parser.add_argument("--xlsx", action="store_true", help="Generar tambien xlsx")
+    parser.add_argument(
+        "-c",
+        "--config",
+        action="append",
+        default=None,
+        help="Argumentos para parse_dgii.py, se puede repetir. Ej: -c='--batch 1000'",
+    )
+    parser.add_argument("-r", "--repeticiones", type=int, default=1)
+    parser.add_argument("--json", type=str, help="Guardar los resultados en JSON")
+    parser.add_argument("--medir", nargs=2, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.medir:
+        archivo, parse_args = args.medir
+        print(json.dumps(medir(archivo, json.loads(parse_args))))
+        return
+
+    configs = [shlex.split(c) for c in args.config or [""]]
+    resultados = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archivos = [str(Path(a).resolve()) for a in args.archivos]
+
+        if not archivos:
+            csv_path = os.path.join(tmp, "casos.csv")
+            filas = generar_casos.generar_filas(args.filas, lineas=args.lineas)
+            generar_casos.escribir_csv(csv_path, filas)
+            archivos.append(csv_path)
+
+            if args.xlsx:
+                xlsx_path = os.path.join(tmp, "casos.xlsx")
+                filas = generar_casos.generar_filas(args.filas, lineas=args.lineas)
+                generar_casos.escribir_xlsx(xlsx_path, filas)
+                archivos.append(xlsx_path)
+
+        for archivo in archivos:
+            for config in configs:
+                # Se queda con la corrida mas rapida de las repeticiones
+                corridas = [correr(archivo, config) for _ in range(args.repeticiones)]
+                resultado = min(corridas, key=lambda r: r["wall"])
+                resultados.append(resultado)
+                imprimir(resultado)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# Genera archivos de casos de prueba sinteticos con la misma plantilla de
+# columnas que espera parse_dgii.py, para medir rendimiento sin usar los
+# libros reales de certificacion de la DGII.
+
+TIPOS_ECF = [31, 32, 33, 34, 41, 43, 44, 45, 46, 47]
+
+# Lineas de detalle que trae la plantilla de la DGII
+BLOQUES_DETALLE = 62
+
+ENCABEZADO_INICIO = [
+    "CasoPrueba",
+    "Version",
+    "TipoeCF",
+    "eNCF",
+    "FechaVencimientoSecuencia",
+    "IndicadorNotaCredito",
+    "IndicadorEnvioDiferido",
+    "IndicadorMontoGravado",
+    "TipoIngresos",
+    "TipoPago",
+    "FechaLimitePago",
+    "TerminoPago",
+]
+
+FORMAS_PAGO = 7
+
+ENCABEZADO_PAGO_EMISOR = [
+    "TipoCuentaPago",
+    "NumeroCuentaPago",
+    "BancoPago",
+    "FechaDesde",
+    "FechaHasta",
+    "TotalPaginas",
+    "RNCEmisor",
+    "RazonSocialEmisor",
+    "NombreComercial",
+    "Sucursal",
+    "DireccionEmisor",
+    "Municipio",
+    "Provincia",
+]
+
+TELEFONOS_EMISOR = 3
+
+ENCABEZADO_EMISOR_TOTALES = [
+    "CorreoEmisor",
+    "WebSite",
+    "ActividadEconomica",
+    "CodigoVendedor",
+    "NumeroFacturaInterna",
+    "NumeroPedidoInterno",
+    "ZonaVenta",
+    "RutaVenta",
+    "InformacionAdicionalEmisor",
+    "FechaEmision",
+    "RNCComprador",
+    "IdentificadorExtranjero",
+    "RazonSocialComprador",
+    "ContactoComprador",
+    "CorreoComprador",
+    "DireccionComprador",
+    "MunicipioComprador",
+    "ProvinciaComprador",
+    "PaisComprador",
+    "FechaEntrega",
+    "ContactoEntrega",
+    "DireccionEntrega",
+    "TelefonoAdicional",
+    "FechaOrdenCompra",
+    "NumeroOrdenCompra",
+    "CodigoInternoComprador",
+    "ResponsablePago",
+    "Informacionadicionalcomprador",
+    "FechaEmbarque",
+    "NumeroEmbarque",
+    "NumeroContenedor",
+    "NumeroReferencia",
+    "NombrePuertoEmbarque",
+    "CondicionesEntrega",
+    "TotalFob",
+    "Seguro",
+    "Flete",
+    "OtrosGastos",
+    "TotalCif",
+    "RegimenAduanero",
+    "NombrePuertoSalida",
+    "NombrePuertoDesembarque",
+    "PesoBruto",
+    "PesoNeto",
+    "UnidadPesoBruto",
+    "UnidadPesoNeto",
+    "CantidadBulto",
+    "UnidadBulto",
+    "VolumenBulto",
+    "UnidadVolumen",
+    "ViaTransporte",
+    "PaisOrigen",
+    "DireccionDestino",
+    "PaisDestino",
+    "RNCIdentificacionCompaniaTransportista",
+    "NombreCompaniaTransportista",
+    "NumeroViaje",
+    "Conductor",
+    "DocumentoTransporte",
+    "Ficha",
+    "Placa",
+    "RutaTransporte",
+    "ZonaTransporte",
+    "NumeroAlbaran",
+    "MontoGravadoTotal",
+    "MontoGravadoI1",
+    "MontoGravadoI2",
+    "MontoGravadoI3",
+    "MontoExento",
+    "ITBIS1",
+    "ITBIS2",
+    "ITBIS3",
+    "TotalITBIS",
+    "TotalITBIS1",
+    "TotalITBIS2",
+    "TotalITBIS3",
+    "MontoImpuestoAdicional",
+]
+
+IMPUESTOS_ADICIONALES = 4
+
+IMPUESTO_ADICIONAL = [
+    "TipoImpuesto",
+    "TasaImpuestoAdicional",
+    "MontoImpuestoSelectivoConsumoEspecifico",
+    "MontoImpuestoSelectivoConsumoAdvalorem",
+    "OtrosImpuestosAdicionales",
+]
+
+ENCABEZADO_TOTALES_OTRA_MONEDA = [
+    "MontoNoFacturable",
+    "MontoPeriodo",
+    "SaldoAnterior",
+    "MontoAvancePago",
+    "ValorPagar",
+    "TotalITBISRetenido",
+    "TotalISRRetencion",
+    "TotalITBISPercepcion",
+    "TotalISRPercepcion",
+    "TipoMoneda",
+    "TipoCambio",
+    "MontoGravadoTotalOtraMoneda",
+    "MontoGravado1OtraMoneda",
+    "MontoGravado2OtraMoneda",
+    "MontoGravado3OtraMoneda",
+    "MontoExentoOtraMoneda",
+    "TotalITBISOtraMoneda",
+    "TotalITBIS1OtraMoneda",
+    "TotalITBIS2OtraMoneda",
+    "TotalITBIS3OtraMoneda",
+    "MontoImpuestoAdicionalOtraMoneda",
+]
+
+SUBTOTALES = [
+    "NumeroSubTotal",
+    "DescripcionSubtotal",
+    "Orden",
+    "SubTotalMontoGravadoTotal",
+    "SubTotalMontoGravadoI1",
+    "SubTotalMontoGravadoI2",
+    "SubTotalMontoGravadoI3",
+    "SubTotaITBIS",
+    "SubTotaITBIS1",
+    "SubTotaITBIS2",
+    "SubTotaITBIS3",
+    "SubTotalImpuestoAdicional",
+    "SubTotalExento",
+    "MontoSubTotal",
+    "Lineas",
+]
+
+DESCUENTOS_RECARGOS = 2
+
+DESCUENTO_RECARGO = [
+    "NumeroLineaDoR",
+    "TipoAjuste",
+    "IndicadorNorma1007",
+    "DescripcionDescuentooRecargo",
+    "TipoValor",
+    "ValorDescuentooRecargo",
+    "MontoDescuentooRecargo",
+    "MontoDescuentooRecargoOtraMoneda",
+    "IndicadorFacturacionDescuentooRecargo",
+]
+
+PAGINAS = 2
+
+PAGINA = [
+    "PaginaNo",
+    "NoLineaDesde",
+    "NoLineaHasta",
+    "SubtotalMontoGravadoPagina",
+    "SubtotalMontoGravado1Pagina",
+    "SubtotalMontoGravado2Pagina",
+    "SubtotalMontoGravado3Pagina",
+    "SubtotalExentoPagina",
+    "SubtotalItbisPagina",
+    "SubtotalItbis1Pagina",
+    "SubtotalItbis2Pagina",
+    "SubtotalItbis3Pagina",
+    "SubtotalImpuestoAdicionalPagina",
+    "SubtotalImpuestoSelectivoConsumoEspecificoPagina",
+    "SubtotalOtrosImpuesto",
+    "MontoSubtotalPagina",
+    "SubtotalMontoNoFacturablePagina",
+]
+
+INFORMACION_REFERENCIA = [
+    "NCFModificado",
+    "RNCOtroContribuyente",
+    "FechaNCFModificado",
+    "CodigoModificacion",
+    "RazonModificacion",
+]
+
+# Sub-grupos de cada linea de detalle, hasta 5 por linea
+SUB_GRUPOS = 5
+
+
+def columnas_detalle(i: int) -> list[str]:
+    columnas = [f"NumeroLinea[{i}]"]
+
+    for j in range(1, SUB_GRUPOS + 1):
+        columnas += [f"TipoCodigo[{i}][{j}]", f"CodigoItem[{i}][{j}]"]
+
+    for name in [
+        "IndicadorFacturacion",
+        "IndicadorAgenteRetencionoPercepcion",
+        "MontoITBISRetenido",
+        "MontoISRRetenido",
+        "NombreItem",
+        "IndicadorBienoServicio",
+        "DescripcionItem",
+        "CantidadItem",
+        "UnidadMedida",
+        "CantidadReferencia",
+        "UnidadReferencia",
+    ]:
+        columnas.append(f"{name}[{i}]")
+
+    for j in range(1, SUB_GRUPOS + 1):
+        columnas += [f"Subcantidad[{i}][{j}]", f"CodigoSubcantidad[{i}][{j}]"]
+
+    for name in [
+        "GradosAlcohol",
+        "PrecioUnitarioReferencia",
+        "FechaElaboracion",
+        "FechaVencimientoItem",
+        "PesoNetoKilogramo",
+        "PesoNetoMineria",
+        "TipoAfiliacion",
+        "Liquidacion",
+        "PrecioUnitarioItem",
+        "DescuentoMonto",
+    ]:
+        columnas.append(f"{name}[{i}]")
+
+    for j in range(1, SUB_GRUPOS + 1):
+        columnas += [
+            f"TipoSubDescuento[{i}][{j}]",
+            f"SubDescuentoPorcentaje[{i}][{j}]",
+            f"MontoSubDescuento[{i}][{j}]",
+        ]
+
+    columnas.append(f"RecargoMonto[{i}]")
+
+    for j in range(1, SUB_GRUPOS + 1):
+        columnas += [
+            f"TipoSubRecargo[{i}][{j}]",
+            f"SubRecargoPorcentaje[{i}][{j}]",
+            f"MontosubRecargo[{i}][{j}]",
+        ]
+
+    columnas += [f"TipoImpuesto[{i}][1]", f"TipoImpuesto[{i}][2]"]
+
+    for name in [
+        "PrecioOtraMoneda",
+        "DescuentoOtraMoneda",
+        "RecargoOtraMoneda",
+        "MontoItemOtraMoneda",
+        "MontoItem",
+    ]:
+        columnas.append(f"{name}[{i}]")
+
+    return columnas
+
+
+def encabezado(bloques_detalle: int = BLOQUES_DETALLE) -> list[str]:
+    header = list(ENCABEZADO_INICIO)
+
+    for i in range(1, FORMAS_PAGO + 1):
+        header += [f"FormaPago[{i}]", f"MontoPago[{i}]"]
+
+    header += ENCABEZADO_PAGO_EMISOR
+    header += [f"TelefonoEmisor[{i}]" for i in range(1, TELEFONOS_EMISOR + 1)]
+    header += ENCABEZADO_EMISOR_TOTALES
+
+    for i in range(1, IMPUESTOS_ADICIONALES + 1):
+        header += [f"{name}[{i}]" for name in IMPUESTO_ADICIONAL]
+
+    header.append("MontoTotal")
+    header += ENCABEZADO_TOTALES_OTRA_MONEDA
+
+    for i in range(1, IMPUESTOS_ADICIONALES + 1):
+        header += [f"{name}OtraMoneda[{i}]" for name in IMPUESTO_ADICIONAL]
+
+    header.append("MontoTotalOtraMoneda")
+
+    for i in range(1, bloques_detalle + 1):
+        header += columnas_detalle(i)
+
+    header += [f"{name}[1]" for name in SUBTOTALES]
+
+    for i in range(1, DESCUENTOS_RECARGOS + 1):
+        header += [f"{name}[{i}]" for name in DESCUENTO_RECARGO]
+
+    for i in range(1, PAGINAS + 1):
+        header += [f"{name}[{i}]" for name in PAGINA]
+
+    header += INFORMACION_REFERENCIA
+
+    return header
+
+
+# Las filas llevan los valores con su tipo: en el xlsx los montos y cantidades
+# quedan como numeros y las fechas como fechas, igual que en un libro real, y
+# en el csv se escriben como texto (Decimal conserva los decimales)
+def fecha(rnd: random.Random) -> datetime:
+    return datetime(2020, 1, 1) + timedelta(days=rnd.randint(0, 1800))
+
+
+def monto(rnd: random.Random, maximo: float = 10_000) -> Decimal:
+    return Decimal(f"{rnd.uniform(1, maximo):.2f}")
+
+
+def texto(value) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%d-%m-%Y")
+
+    return str(value)
+
+
+def generar_fila(
+    header: dict[str, int],
+    n: int,
+    rnd: random.Random,
+    lineas: tuple[int, int] = (1, 8),
+    formas_pago: tuple[int, int] = (0, 3),
+    subdescuentos: float = 0.3,
+    paginacion: float = 0.2,
+) -> list:
+    fila: list = ["#e"] * len(header)
+
+    def poner(name: str, value):
+        fila[header[name]] = value
+
+    tipo = TIPOS_ECF[n % len(TIPOS_ECF)]
+    encf = f"E{tipo}{n:010d}"
+
+    poner("CasoPrueba", f"101672919{encf}")
+    poner("Version", "1.0")
+    poner("TipoeCF", tipo)
+    poner("eNCF", encf)
+    poner("FechaVencimientoSecuencia", datetime(2028, 12, 31))
+    poner("IndicadorMontoGravado", rnd.randint(0, 1))
+    poner("TipoIngresos", "01")
+    poner("TipoPago", rnd.randint(1, 3))
+    poner("RNCEmisor", "101672919")
+    poner("RazonSocialEmisor", "DOCUMENTOS ELECTRONICOS DE 02")
+    poner("DireccionEmisor", "AVE. ISABEL AGUIAR NO. 269, ZONA INDUSTRIAL DE HERRERA")
+    poner("FechaEmision", fecha(rnd))
+
+    if tipo not in (43, 47):
+        poner("RNCComprador", "131880681")
+        poner("RazonSocialComprador", "DOCUMENTOS ELECTRONICOS DE 03")
+
+    # Tipo 32 por debajo y por encima del tope de resumen
+    total = rnd.choice([monto(rnd, 249_999), monto(rnd, 900_000)])
+    poner("MontoGravadoTotal", total)
+    poner("MontoTotal", total)
+
+    for i in range(1, rnd.randint(*formas_pago) + 1):
+        poner(f"FormaPago[{i}]", rnd.randint(1, 8))
+        poner(f"MontoPago[{i}]", monto(rnd))
+
+    for i in range(1, rnd.randint(0, TELEFONOS_EMISOR) + 1):
+        poner(f"TelefonoEmisor[{i}]", f"809-472-{rnd.randint(1000, 9999)}")
+
+    for i in range(1, rnd.randint(0, 2) + 1):
+        poner(f"TipoImpuesto[{i}]", rnd.choice(["006", "010", "016"]))
+        poner(f"TasaImpuestoAdicional[{i}]", Decimal("632.58"))
+        poner(f"MontoImpuestoSelectivoConsumoEspecifico[{i}]", monto(rnd))
+
+    if rnd.random() < 0.2:
+        poner("TipoMoneda", "USD")
+        poner("TipoCambio", Decimal("58.50"))
+        poner("MontoTotalOtraMoneda", monto(rnd))
+        poner("TipoImpuestoOtraMoneda[1]", "006")
+        poner("TasaImpuestoAdicionalOtraMoneda[1]", Decimal("10.81"))
+
+    cantidad_lineas = rnd.randint(*lineas)
+
+    for i in range(1, cantidad_lineas + 1):
+        poner(f"NumeroLinea[{i}]", i)
+
+        for j in range(1, rnd.randint(0, 2) + 1):
+            poner(f"TipoCodigo[{i}][{j}]", "INTERNA")
+            poner(f"CodigoItem[{i}][{j}]", f"COD{i:04d}{j}")
+
+        poner(f"IndicadorFacturacion[{i}]", rnd.randint(1, 4))
+        poner(f"NombreItem[{i}]", f"Producto {i}")
+        poner(f"IndicadorBienoServicio[{i}]", rnd.randint(1, 2))
+        poner(f"CantidadItem[{i}]", Decimal(f"{rnd.randint(1, 20)}.00"))
+        poner(f"UnidadMedida[{i}]", 43)
+        poner(f"PrecioUnitarioItem[{i}]", monto(rnd, 5_000))
+        poner(f"MontoItem[{i}]", monto(rnd))
+
+        if rnd.random() < 0.3:
+            poner(f"FechaElaboracion[{i}]", fecha(rnd))
+            poner(f"FechaVencimientoItem[{i}]", fecha(rnd))
+            poner(f"Subcantidad[{i}][1]", Decimal("1.000"))
+            poner(f"CodigoSubcantidad[{i}][1]", 43)
+
+        if rnd.random() < subdescuentos:
+            poner(f"DescuentoMonto[{i}]", monto(rnd, 500))
+
+            for j in range(1, rnd.randint(1, SUB_GRUPOS) + 1):
+                poner(f"TipoSubDescuento[{i}][{j}]", "%")
+                poner(f"SubDescuentoPorcentaje[{i}][{j}]", Decimal("5.00"))
+                poner(f"MontoSubDescuento[{i}][{j}]", monto(rnd, 100))
+
+        if rnd.random() < 0.1:
+            poner(f"RecargoMonto[{i}]", monto(rnd, 500))
+            poner(f"TipoSubRecargo[{i}][1]", "$")
+            poner(f"MontosubRecargo[{i}][1]", monto(rnd, 500))
+
+        if rnd.random() < 0.2:
+            poner(f"TipoImpuesto[{i}][1]", "006")
+
+    if rnd.random() < 0.3:
+        poner("NumeroLineaDoR[1]", 1)
+        poner("TipoAjuste[1]", rnd.choice(["D", "R"]))
+        poner("DescripcionDescuentooRecargo[1]", "Descuento por pronto pago")
+        poner("TipoValor[1]", "$")
+        poner("MontoDescuentooRecargo[1]", monto(rnd, 500))
+
+    if cantidad_lineas and rnd.random() < paginacion:
+        mitad = (cantidad_lineas + 1) // 2
+
+        for pagina, (desde, hasta) in enumerate(
+            [(1, mitad), (mitad + 1, cantidad_lineas)][:PAGINAS], start=1
+        ):
+            if desde > hasta:
+                continue
+
+            poner(f"PaginaNo[{pagina}]", pagina)
+            poner(f"NoLineaDesde[{pagina}]", desde)
+            poner(f"NoLineaHasta[{pagina}]", hasta)
+            poner(f"MontoSubtotalPagina[{pagina}]", monto(rnd))
+
+    # Notas de debito y credito modifican un comprobante anterior
+    if tipo in (33, 34):
+        poner("NCFModificado", f"E31{n:010d}")
+        poner("FechaNCFModificado", fecha(rnd))
+        poner("CodigoModificacion", rnd.randint(1, 5))
+
+    return fila
+
+
+def generar_filas(filas: int, semilla: int = 42, **opciones):
+    bloques = opciones.pop("bloques_detalle", BLOQUES_DETALLE)
+    header = encabezado(bloques)
+    indice = {name: i for i, name in enumerate(header)}
+    rnd = random.Random(semilla)
+
+    yield header
+
+    for n in range(1, filas + 1):
+        yield generar_fila(indice, n, rnd, **opciones)
+
+
+def escribir_csv(path: str, filas) -> None:
+    with open(path, "w", encoding="latin-1") as f:
+        f.writelines("|".join(map(texto, fila)) + "\n" for fila in filas)
+
+
+def escribir_xlsx(path: str, filas) -> None:
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+
+    for n, fila in enumerate(filas):
+        # En el libro las celdas vacias no llevan "#e"
+        sheet.append(fila if n == 0 else [v if v != "#e" else None for v in fila])
+
+    workbook.save(path)
+
+
+def rango(texto: str) -> tuple[int, int]:
+    minimo, _, maximo = texto.partition("-")
+    return int(minimo), int(maximo or minimo)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Generador de casos de prueba DGII",
+        description="Genera archivos csv (separados por '|') o xlsx sinteticos "
+        "con la plantilla de columnas que usa parse_dgii.py.",
+    )
+
+    parser.add_argument("salida", type=str, help="Archivo .csv o .xlsx a generar")
+    parser.add_argument("-n", "--filas", type=int, default=100)
+    parser.add_argument(
+        "--lineas",
+        type=rango,
+        default=(1, 8),
+        help="Lineas de detalle por comprobante, un numero o un rango 'min-max'",
+    )
+    parser.add_argument(
+        "--bloques-detalle",
+        type=int,
+        default=BLOQUES_DETALLE,
+        help="Lineas de detalle en la plantilla (hasta 1000)",
+    )
+    parser.add_argument(
+        "--formas-pago",
+        type=rango,
+        default=(0, 3),
+        help=f"Formas de pago por comprobante, rango 'min-max' (max {FORMAS_PAGO})",
+    )
+    parser.add_argument(
+        "--subdescuentos",
+        type=float,
+        default=0.3,
+        help="Probabilidad de que una linea tenga subdescuentos",
+    )
+    parser.add_argument(
+        "--paginacion",
+        type=float,
+        default=0.2,
+        help="Probabilidad de que un comprobante tenga paginacion",
+    )
+    parser.add_argument("--semilla", type=int, default=42)
+
+    args = parser.parse_args()
+
+    if not 0 <= args.bloques_detalle <= 1000:
+        parser.error("--bloques-detalle debe estar entre 0 y 1000")
+
+    if args.lineas[1] > args.bloques_detalle:
+        parser.error("--lineas no puede ser mayor que --bloques-detalle")
+
+    if args.formas_pago[1] > FORMAS_PAGO:
+        parser.error(f"--formas-pago no puede ser mayor que {FORMAS_PAGO}")
+
+    filas = generar_filas(
+        args.filas,
+        semilla=args.semilla,
+        bloques_detalle=args.bloques_detalle,
+        lineas=args.lineas,
+        formas_pago=args.formas_pago,
+        subdescuentos=args.subdescuentos,
+        paginacion=args.paginacion,
+    )
+
+    if args.salida.endswith(".xlsx"):
+        escribir_xlsx(args.salida, filas)
+    else:
+        escribir_csv(args.salida, filas)
+
+    print(f"Result saved at: {Path(args.salida).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
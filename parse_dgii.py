@@ -1,18 +1,157 @@
 import csv
+import glob
+import json
+import hashlib
+import os
+import queue
+import signal
+import sys
+import threading
+import time
 import argparse
+import inspect
+import contextlib
+import io
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache, wraps
 from pathlib import Path
 from datetime import datetime
-from typing import Any, TypedDict, get_type_hints
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Iterator,
+    NamedTuple,
+    NewType,
+    TypedDict,
+    get_type_hints,
+)
 
 
 CODIGO_EMPRESA = 1
 
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Filas que se envian juntas a cada proceso con --jobs
+JOBS_CHUNK_SIZE = 16
+
+# Archivos que se toman al pasar un directorio o un patron
+EXTENSIONES_ENTRADA = (".csv", ".xlsx")
+
+# Con --pipeline, las filas pasan entre hilos en bloques de PIPELINE_FILAS y
+# cada cola acepta hasta PIPELINE_BLOQUES bloques (de filas, o de hasta
+# --buffer-size bytes para escribir)
+PIPELINE_FILAS = 16
+PIPELINE_BLOQUES = 4
 
-class Line(TypedDict):
+
+class Column(NamedTuple):
     name: str
-    value: Any | None
+    base: str
     level: int
+    groups: tuple[int, ...]
+    origin_col: int
+
+
+# A donde va el valor de una columna: tabla destino, grupo dentro de la
+# seccion ([1], [2], ...) y campo del registro, con su conversion ya resuelta
+class Ruta(NamedTuple):
     origin_col: int
+    tabla: str
+    grupo: int
+    campo: str
+    converter: Callable[[Any], Any]
+
+
+class BloqueDetalle(NamedTuple):
+    # Columna de NumeroLinea[n] en la fila
+    col_numero_linea: int
+    rutas: list[Ruta]
+
+
+# Columnas [inicio, fin) de una seccion y los indices de grupo que trae
+class Seccion(NamedTuple):
+    inicio: int
+    fin: int
+    grupos: tuple[int, ...]
+
+
+# Una linea de detalle, desde NumeroLinea[numero]; sus secciones van agrupadas
+# por el segundo indice
+class LineaDetalle(NamedTuple):
+    numero: int
+    inicio: int
+    fin: int
+    secciones: dict[str, Seccion]
+
+
+# Donde esta cada cosa en la plantilla, sacado de los nombres del encabezado
+# (ver compile_layout) en vez de posiciones fijas
+class Layout(NamedTuple):
+    nombre_archivo: int
+    tipo_ecf: int
+    encf: int
+    monto_total: int
+    secciones: dict[str, Seccion]
+    detalle: list[LineaDetalle]
+
+
+class Schema(NamedTuple):
+    columns: list[Column]
+    rutas: list[Ruta]
+    bloques_detalle: list[BloqueDetalle]
+    # Columnas con indices que no van a ninguna tabla
+    sueltas: list[str]
+    layout: Layout
+
+
+class Registros(NamedTuple):
+    encf: str
+    empresa: int
+    nombre_archivo: str
+    enviar_a_dgii_por_resumen: bool
+    # tabla -> grupo -> registro
+    secciones: dict[str, dict[int, dict[str, Any]]]
+    # (NumeroLinea, tabla -> grupo -> registro) por cada linea de detalle
+    detalle: list[tuple[int, dict[str, dict[int, dict[str, Any]]]]]
+
+
+# Lo que no cambia entre registros de una tabla con las mismas llaves: el orden
+# de las columnas y el inicio del INSERT ya formateado
+class PlantillaInsert(NamedTuple):
+    table_name: str
+    # Llaves del registro en el orden de las columnas
+    keys: tuple[str, ...]
+    columns: tuple[str, ...]
+    prefijo: str
+
+
+# Una fila ya leida: los valores de la fila y el layout del schema, compartido
+# por todas las filas del archivo
+class Lines(NamedTuple):
+    values: list[str | None]
+    layout: Layout
+
+
+# Columnas DATE y DATETIME: se normalizan a YYYY-MM-DD al leerlas
+Date = NewType("Date", str)
+DateTime = NewType("DateTime", str)
+
+
+# Valor de las columnas DATETIME que llena el servidor: GETDATE() en res.sql y
+# la fecha de la corrida con --bulk y --dsn
+class FechaServidor:
+    def __repr__(self) -> str:
+        return "FECHA_SERVIDOR"
+
+    def __reduce__(self) -> str:
+        # Los registros que vuelven de -j siguen siendo el mismo objeto
+        return "FECHA_SERVIDOR"
+
+
+FECHA_SERVIDOR = FechaServidor()
 
 
 class Encabezado(TypedDict):
@@ -49,18 +188,18 @@ class Encabezado(TypedDict):
     Estatus: bool
     EstatusEnvioDgii: str
     EstatusEnvioReceptor: str
-    FechaActualizacionEstadoValidacionDgii: str  # DATETIME
-    FechaCreacion: str  # DATETIME
-    FechaDesde: str  # DATE
-    FechaEmbarque: str  # DATE
-    FechaEmision: str  # DATE
-    FechaEntrega: str  # DATE
-    FechaHasta: str  # DATE
-    FechaHoraFirma: str  # DATETIME
-    FechaLimitePago: str  # DATE
-    FechaNCFModificado: str  # DATE
-    FechaOrdenCompra: str  # DATE
-    FechaVencimientoSecuencia: str  # DATE
+    FechaActualizacionEstadoValidacionDgii: DateTime
+    FechaCreacion: DateTime
+    FechaDesde: Date
+    FechaEmbarque: Date
+    FechaEmision: Date
+    FechaEntrega: Date
+    FechaHasta: Date
+    FechaHoraFirma: DateTime
+    FechaLimitePago: Date
+    FechaNCFModificado: Date
+    FechaOrdenCompra: Date
+    FechaVencimientoSecuencia: Date
     Ficha: str
     Flete: float
     IdentificadorExtranjero: str
@@ -161,8 +300,8 @@ class Encabezado(TypedDict):
     TotalITBISRetenido: float
     TotalPaginas: int
     TrackId: str
-    UltimaFechaEnvioDgii: str  # DATETIME
-    UltimaFechaEnvioReceptor: str  # DATETIME
+    UltimaFechaEnvioDgii: DateTime
+    UltimaFechaEnvioReceptor: DateTime
     UnidadBulto: int
     UnidadPesoBruto: int
     UnidadPesoNeto: int
@@ -223,8 +362,8 @@ class DetalleEncabezado(TypedDict):
     DescripcionItem: str
     DescuentoMonto: float
     DescuentoOtraMoneda: float
-    FechaElaboracion: str  # DATE
-    FechaVencimientoItem: str  # DATE
+    FechaElaboracion: Date
+    FechaVencimientoItem: Date
     GradosAlcohol: float
     IndicadorAgenteRetencionoPercepcion: int
     Liquidacion: int
@@ -245,7 +384,7 @@ class DetalleEncabezado(TypedDict):
 class DetalleItem(TypedDict):
     eNCF: str
     CodEmpresa: int
-    NumeroLinea: int
+    NumeroLinea_Detalle: int
     TipoCodigo: str
     CodigoItem: str
 
@@ -253,7 +392,7 @@ class DetalleItem(TypedDict):
 class DetalleSubcantidad(TypedDict):
     eNCF: str
     CodEmpresa: int
-    NumeroLinea: int
+    NumeroLinea_Detalle: int
     Subcantidad: float
     CodigoSubcantidad: int
 
@@ -261,7 +400,7 @@ class DetalleSubcantidad(TypedDict):
 class DetalleSubdescuento(TypedDict):
     eNCF: str
     CodEmpresa: int
-    NumeroLinea: int
+    NumeroLinea_Detalle: int
 
     TipoSubDescuento: str
     SubDescuentoPorcentaje: float
@@ -271,7 +410,7 @@ class DetalleSubdescuento(TypedDict):
 class DetalleSubrecargo(TypedDict):
     eNCF: str
     CodEmpresa: int
-    NumeroLinea: int
+    NumeroLinea_Detalle: int
 
     TipoSubRecargo: str
     SubRecargoPorcentaje: float
@@ -281,7 +420,7 @@ class DetalleSubrecargo(TypedDict):
 class DetalleInpuestosAdicionales(TypedDict):
     eNCF: str
     CodEmpresa: int
-    NumeroLinea: int
+    NumeroLinea_Detalle: int
     TipoImpuesto: str
 
 
@@ -322,666 +461,2992 @@ class Paginacion(TypedDict):
     SubtotalMontoNoFacturablePagina: float
 
 
-def load_exel(file_path: str):
-    import openpyxl
+def to_int(value: Any) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
 
-    # Load the workbook and select the active worksheet
-    workbook = openpyxl.load_workbook(file_path, data_only=True, read_only=True)
-    sheet = workbook.active
 
-    # Read data from the worksheet
-    data = []
+def to_bool(value: Any) -> bool:
+    return str(value).strip().lower() in ("1", "true", "si", "verdadero")
 
-    keys = []
 
-    # Get the header row
-    for cell in sheet[1]:
-        keys.append(cell.value)
+@lru_cache(maxsize=1024)
+def to_date(value: Any) -> str:
+    # La plantilla trae DD-MM-YYYY y el xlsx ya YYYY-MM-DD. Se revisa la forma
+    # en vez de probar y atrapar la excepcion, y como los mismos pocos dias se
+    # repiten en miles de filas el resultado queda en cache
+    value = str(value).strip()
+    sep = "-" if "-" in value else "/"
+    parts = value.split(sep)
 
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        row_data = {}
-        for i, cell in enumerate(row):
-            cell_content: str | int | float | bool | None = None
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return value
 
-            if isinstance(cell, bool):
-                cell_content = bool(cell)
+    day, month, year = parts
 
-            if isinstance(cell, str):
-                cell_content = cell.strip()
+    if len(day) == 4:
+        year, month, day = parts
+    elif len(year) != 4:
+        return value
 
-            if isinstance(cell, datetime):
-                cell_content = cell.strftime("%Y-%m-%d")
+    return f"{year}-{month:0>2}-{day:0>2}"
 
-            # if cell_content can be converted to a number, do it
-            if isinstance(cell_content, str) and cell_content.isdigit():
-                cell_content = float(cell_content)
 
-                if cell_content.is_integer():
-                    cell_content = int(cell_content)
+@lru_cache(maxsize=1024)
+def to_datetime(value: Any) -> str:
+    fecha, _, hora = str(value).strip().partition(" ")
+    return f"{to_date(fecha)} {hora}" if hora else to_date(fecha)
 
-            if cell_content is None:
-                cell_content = "#e"
 
-            row_data[keys[i]] = cell_content
+TYPE_CONVERTERS: dict[Any, Callable[[Any], Any]] = {
+    int: to_int,
+    float: float,
+    bool: to_bool,
+    str: str,
+    Date: to_date,
+    DateTime: to_datetime,
+}
 
-        data.append(row_data)
 
-    return data
+def compile_converters(record_type: type) -> dict[str, Callable[[Any], Any]]:
+    return {
+        name: TYPE_CONVERTERS.get(hint, hint)
+        for name, hint in get_type_hints(record_type).items()
+    }
 
 
-def read_csv_as_dicts(
-    file: str, delimiter: str = ",", encoding: str = "latin-1"
-) -> list[dict[str, str]]:
-    with open(file, newline="", encoding=encoding) as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        return [dict(row) for row in reader]
+# Tablas destino en orden de dependencia (llaves foraneas): los padres primero
+TABLAS: dict[str, type] = {
+    "Comprobantes_Emitidos": Encabezado,
+    "Comprobantes_Emitidos_Formas_Pago": FormaPago,
+    "Comprobantes_Emitidos_Telefonos_Emisor": TelefonoEmisor,
+    "Comprobantes_Emitidos_Impuestos_Adicionales": InpuestosAdicionales,
+    "Comprobantes_Emitidos_Impuestos_Adicionales_Otra_Moneda": (
+        InpuestosAdicionalesOtraMoneda
+    ),
+    "Comprobantes_Emitidos_Detalle": DetalleEncabezado,
+    "Comprobantes_Emitidos_Detalle_Item": DetalleItem,
+    "Comprobantes_Emitidos_Detalle_Subcantidad": DetalleSubcantidad,
+    "Comprobantes_Emitidos_Detalle_SubDescuento": DetalleSubdescuento,
+    "Comprobantes_Emitidos_Detalle_SubRecargo": DetalleSubrecargo,
+    "Comprobantes_Emitidos_Detalle_Impuestos_Adicionales": DetalleInpuestosAdicionales,
+    "Comprobantes_Emitidos_Descuento_Recargo": DescuentoRecargo,
+    "Comprobantes_Emitidos_Paginacion": Paginacion,
+}
+
+TABLAS_ORDEN = {table_name: i for i, table_name in enumerate(TABLAS)}
+
+# Se resuelve una sola vez al importar el modulo, no en cada fila
+RECORD_CONVERTERS: dict[type, dict[str, Callable[[Any], Any]]] = {
+    record_type: compile_converters(record_type) for record_type in TABLAS.values()
+}
+
+# SQL Server no acepta mas de 1000 filas en un solo INSERT ... VALUES
+MAX_BATCH_ROWS = 1000
+
+# Tablas con grupos ([1], [2], ...) fuera de las lineas de detalle
+TABLAS_SECCIONES = (
+    "Comprobantes_Emitidos_Formas_Pago",
+    "Comprobantes_Emitidos_Telefonos_Emisor",
+    "Comprobantes_Emitidos_Impuestos_Adicionales",
+    "Comprobantes_Emitidos_Impuestos_Adicionales_Otra_Moneda",
+    "Comprobantes_Emitidos_Descuento_Recargo",
+    "Comprobantes_Emitidos_Paginacion",
+)
 
+# Tablas de cada linea de detalle, agrupadas por el segundo indice
+TABLAS_DETALLE = (
+    "Comprobantes_Emitidos_Detalle_Item",
+    "Comprobantes_Emitidos_Detalle_Subcantidad",
+    "Comprobantes_Emitidos_Detalle_SubDescuento",
+    "Comprobantes_Emitidos_Detalle_SubRecargo",
+    "Comprobantes_Emitidos_Detalle_Impuestos_Adicionales",
+)
 
-def save_csv(data: list[dict]) -> str:
-    keys = data[0].keys()
+# Campo -> tabla, para saber a que seccion va una columna por su nombre. Los
+# campos de cada grupo de tablas no se repiten entre ellas
+_CAMPOS_COMUNES = {"eNCF", "CodEmpresa", "NumeroLinea_Detalle"}
+
+CAMPOS_SECCIONES = {
+    campo: tabla
+    for tabla in TABLAS_SECCIONES
+    for campo in RECORD_CONVERTERS[TABLAS[tabla]]
+    if campo not in _CAMPOS_COMUNES
+}
+
+CAMPOS_DETALLE = {
+    campo: tabla
+    for tabla in TABLAS_DETALLE
+    for campo in RECORD_CONVERTERS[TABLAS[tabla]]
+    if campo not in _CAMPOS_COMUNES
+}
+
+# Los subtotales de la plantilla no tienen tabla en la base de datos
+CAMPOS_SIN_TABLA = {
+    "NumeroSubTotal",
+    "DescripcionSubtotal",
+    "Orden",
+    "SubTotalMontoGravadoTotal",
+    "SubTotalMontoGravadoI1",
+    "SubTotalMontoGravadoI2",
+    "SubTotalMontoGravadoI3",
+    "SubTotaITBIS",
+    "SubTotaITBIS1",
+    "SubTotaITBIS2",
+    "SubTotaITBIS3",
+    "SubTotalImpuestoAdicional",
+    "SubTotalExento",
+    "MontoSubTotal",
+    "Lineas",
+}
+
+
+SQL_INICIO = """\
+DECLARE @errormensage varchar(max)
 
-    fname = "res.csv"
+BEGIN TRY
+BEGIN TRANSACTION
 
-    with open(fname, "w") as f:
-        f.write("|".join(keys) + "\n")
+"""
 
-        for row in data:
-            f.write("|".join([str(row[key]) for key in keys]) + "\n")
+SQL_FIN = """\
 
-    return fname
 
+COMMIT TRANSACTION
+END TRY
+BEGIN CATCH
+    ROLLBACK TRANSACTION;
+    set @errormensage = ERROR_MESSAGE()
+    RAISERROR(@errormensage,15,217)
+END CATCH"""
 
-def get_encf(lines: list[Line]):
-    return str(lines[3]["value"])
 
+# Tiempos y llamadas por etapa, y registros y bytes por tabla, para --stats
+class Stats:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: dict[str, list[float]] = {}
+        self.tablas: dict[str, list[int]] = {}
+        # Con --pipeline la lectura se mide desde otro hilo
+        self._lock = threading.Lock()
+
+    def etapa(self, name: str, segundos: float, llamadas: int = 1):
+        with self._lock:
+            etapa = self.etapas.setdefault(name, [0, 0.0])
+            etapa[0] += llamadas
+            etapa[1] += segundos
+
+    def tabla(self, table_name: str, registros: int, size: int, sentencias: int = 1):
+        with self._lock:
+            tabla = self.tablas.setdefault(table_name, [0, 0, 0])
+            tabla[0] += registros
+            tabla[1] += sentencias
+            tabla[2] += size
+
+    def merge(self, other: dict):
+        for name, etapa in other["etapas"].items():
+            self.etapa(name, etapa["segundos"], etapa["llamadas"])
+
+        for table_name, tabla in other["tablas"].items():
+            self.tabla(
+                table_name, tabla["registros"], tabla["bytes"], tabla["sentencias"]
+            )
 
-def get_numero_linea_det(lines: list[Line]):
-    try:
-        return int(lines[0]["value"])
-    except Exception:
-        return None
+    def as_dict(self) -> dict:
+        return {
+            "wall": time.perf_counter() - self.inicio,
+            "etapas": {
+                name: {"llamadas": llamadas, "segundos": segundos}
+                for name, (llamadas, segundos) in self.etapas.items()
+            },
+            "tablas": {
+                table_name: {
+                    "registros": registros,
+                    "sentencias": sentencias,
+                    "bytes": size,
+                }
+                for table_name, (registros, sentencias, size) in sorted(
+                    self.tablas.items(), key=lambda item: TABLAS_ORDEN[item[0]]
+                )
+            },
+        }
+
+    def imprimir(self):
+        data = self.as_dict()
+        wall = data["wall"]
+
+        # Las etapas anidadas se cuentan dentro de la etapa que las llama, y con
+        # --jobs se suman los tiempos de todos los procesos
+        print(f"\n{'Etapa':<48}{'llamadas':>10}{'segundos':>10}{'%':>8}")
+
+        for name, etapa in sorted(
+            data["etapas"].items(), key=lambda item: -item[1]["segundos"]
+        ):
+            segundos = etapa["segundos"]
+            print(
+                f"{name:<48}{etapa['llamadas']:>10}{segundos:>10.3f}"
+                f"{segundos / wall:>8.1%}"
+            )
 
+        print(f"\n{'Tabla':<58}{'registros':>10}{'sentencias':>11}{'bytes':>12}")
 
-def group_section(
-    lines: list[Line],
-    start: int | None = None,
-    end: int | None = None,
-    ignore_none: bool = True,
-    level: int = 1,
-) -> dict[int, list[Line]]:
+        for table_name, tabla in data["tablas"].items():
+            print(
+                f"{table_name:<58}{tabla['registros']:>10}"
+                f"{tabla['sentencias']:>11}{tabla['bytes']:>12}"
+            )
 
-    groups = {}
+        print(f"\nTiempo total: {wall:.3f} s")
 
-    if start is not None and end is not None:
-        _slice = lines[start:end]
-    elif end is None and start is not None:
-        _slice = lines[start:]
-    elif start is None and end is not None:
-        _slice = lines[:end]
-    else:
-        _slice = lines
 
-    for line in _slice:
-        if line["value"] is None and ignore_none:
-            continue
+STATS: Stats | None = None
 
-        group = int(line["name"].split("[")[level].split("]")[0])
 
-        if group in groups:
-            groups[group].append(line)
-        else:
-            groups[group] = [line]
+def medido(func):
+    # Sin --stats solo cuesta revisar STATS en cada llamada
+    name = func.__qualname__
 
-    return groups
+    if inspect.isgeneratorfunction(func):
 
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            if STATS is None:
+                yield from func(*args, **kwargs)
+                return
 
-def generar_insert(data: dict[str, Any], table_name: str) -> str:
-    columns_present = sorted(
-        set([key if key != "NumeroLineaDoR" else "NumeroLinea" for key in data.keys()])
-    )
+            it = func(*args, **kwargs)
+
+            while True:
+                start = time.perf_counter()
+
+                try:
+                    item = next(it)
+                except StopIteration:
+                    STATS.etapa(name, time.perf_counter() - start, 0)
+                    return
+
+                STATS.etapa(name, time.perf_counter() - start)
+                yield item
+
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if STATS is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
 
-    if "NumeroLineaDoR" in data:
-        data["NumeroLinea"] = data["NumeroLineaDoR"]
-        del data["NumeroLineaDoR"]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            STATS.etapa(name, time.perf_counter() - start)
 
-    for key in data.keys():
-        if "Fecha" in key:
+    return wrapper
+
+
+_FIN = object()
+
+
+def en_hilo(
+    items: Iterator[Any], size: int = PIPELINE_FILAS, maxsize: int = PIPELINE_BLOQUES
+) -> Iterator[Any]:
+    # Produce los items en otro hilo. La cola acotada frena al productor cuando
+    # el consumidor se atrasa, asi la memoria no crece con el archivo, y pasar
+    # los items en bloques evita cambiar de hilo en cada uno
+    cola: queue.Queue = queue.Queue(maxsize)
+    detener = threading.Event()
+    errores: list[BaseException] = []
+
+    def poner(item: Any) -> bool:
+        while not detener.is_set():
             try:
-                day, month, year = data[key].split("-")
-                data[key] = f"{year}-{month}-{day}"
-            except Exception:
+                cola.put(item, timeout=0.1)
+                return True
+            except queue.Full:
                 pass
 
-    values = [
-        f"'{data[name]}'" if isinstance(data[name], str) else str(data[name])
-        for name in columns_present
-    ]
+        return False
 
-    query = f"""\
+    def producir():
+        bloque = []
 
-INSERT INTO {table_name}(
-    {"\n    ,".join(columns_present)}
-)
-VALUES (
-    {"\n    ,".join(values)}
-)
+        try:
+            for item in items:
+                bloque.append(item)
 
-"""
-    query = query.replace("'GETDATE()'", "GETDATE()")
+                if len(bloque) >= size:
+                    if not poner(bloque):
+                        return
 
-    with open("res.sql", "a") as f:
-        f.write(query)
+                    bloque = []
 
-    return query
+            if bloque:
+                poner(bloque)
+        except BaseException as e:
+            errores.append(e)
+        finally:
+            poner(_FIN)
 
+    hilo = threading.Thread(target=producir, name="lector", daemon=True)
+    hilo.start()
 
-def procesar_encabezado(lines: list[Line]):
-    level_0 = []
+    try:
+        while (bloque := cola.get()) is not _FIN:
+            yield from bloque
+    finally:
+        detener.set()
+        hilo.join()
+
+    if errores:
+        raise errores[0]
+
+
+# Archivo que escribe desde otro hilo, para que la escritura en disco se solape
+# con la conversion de las filas. close() espera a que se escriba todo
+class ArchivoEnHilo:
+    def __init__(self, file: Any, maxsize: int = PIPELINE_BLOQUES):
+        self._file = file
+        self._cola: queue.Queue = queue.Queue(maxsize)
+        self._error: BaseException | None = None
+        self._hilo = threading.Thread(
+            target=self._escribir, name="escritor", daemon=True
+        )
+        self._hilo.start()
+
+    def _escribir(self):
+        # Despues de un error se sigue vaciando la cola para no bloquear a write()
+        while (text := self._cola.get()) is not _FIN:
+            if self._error is None:
+                try:
+                    self._file.write(text)
+                except BaseException as e:
+                    self._error = e
+
+    def write(self, text: str):
+        if self._error is not None:
+            raise self._error
+
+        self._cola.put(text)
+
+    def close(self):
+        self._cola.put(_FIN)
+        self._hilo.join()
+        self._file.close()
+
+        if self._error is not None:
+            raise self._error
+
+
+# Mantiene res.sql abierto durante toda la corrida y escribe en bloques grandes
+class SqlWriter:
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        batch_rows: int = 1,
+        commit_every: int = 0,
+        split_every: int = 0,
+        split_bytes: int = 0,
+        pipeline: bool = False,
+    ):
+        self.buffer_size = buffer_size
+        self.pipeline = pipeline
+        self.batch_rows = batch_rows
+        self.commit_every = commit_every
+        self.split_every = split_every
+        self.split_bytes = split_bytes
+        self._pending: list[str] = []
+        self._pending_size = 0
+        self._batches: dict[tuple[str, tuple[str, ...]], list[list[str]]] = {}
+        self._reemplazar: dict[str, int] = {}
+        self._eliminar_al_final: list[tuple[str, int]] = []
+        self._en_transaccion = 0
+        self._en_archivo = 0
+        self._bytes_archivo = 0
+        # Bytes aproximados de las filas que esperan en _batches, por clave
+        self._bytes_lotes: dict[tuple[str, tuple[str, ...]], int] = {}
+        self._temporales: list[tuple[str, str]] = []
+
+        # Al partir en varios archivos quedan res_0001.sql, res_0002.sql, ...
+        self._base = Path(path)
+        self._numero_archivo = 1
+        self.path = self._nombre_archivo() if split_every or split_bytes else path
+        self.archivos = [self.path]
+        self._file = self._abrir(self.path)
+
+    def _abrir(self, path: str | Path, **kwargs) -> Any:
+        # Se escribe en un temporal que close renombra al terminar, asi un error
+        # a medio camino no deja la salida truncada ni pisa la anterior
+        temporal = f"{path}.{os.getpid()}.tmp"
+        self._temporales.append((temporal, str(path)))
+        f = open(temporal, "w", **kwargs)
+        return ArchivoEnHilo(f) if self.pipeline else f
+
+    def _publicar(self):
+        for temporal, path in self._temporales:
+            os.replace(temporal, path)
+
+    def _descartar(self, archivos: list[Any]):
+        for f in archivos:
+            with contextlib.suppress(Exception):
+                f.close()
+
+        for temporal, _ in self._temporales:
+            with contextlib.suppress(OSError):
+                os.remove(temporal)
+
+    def _nombre_archivo(self) -> str:
+        base = self._base
+        return str(
+            base.with_name(f"{base.stem}_{self._numero_archivo:04d}{base.suffix}")
+        )
 
-    for line in lines:
-        if line["level"] == 0:
-            level_0.append(line)
+    def write(self, text: str):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        self._bytes_archivo += len(text)
 
-    # Si tipo ecf = 32 y montototal < 250000 true else false
-    enviar_a_dgii_por_resumen = str(
-        int(lines[2]["value"]) == 32 and float(lines[139]["value"]) < 250_000
-    )
+        if self._pending_size >= self.buffer_size:
+            self.flush()
 
-    encabezado: Encabezado = {
-        "CodEmpresa": CODIGO_EMPRESA,
-        "FechaHoraFirma": "GETDATE()",
-        "FechaCreacion": "GETDATE()",
-        "Estatus": "True",
-        "EnviaraDgiiPorResumen": enviar_a_dgii_por_resumen,
-        "EnviarAReceptor": "False",
-        "EstatusEnvioDgii": "Pendiente",
-        "EstatusEnvioReceptor": "Pendiente",
-        "NombreDispositivoCreador": "Interno",
-        "CantidadIntentosEnviosDgii": 0,
-        "CantidadIntentosEnviosReceptor": 0,
-        "NombreArchivo": str(level_0[0]["value"]) + ".xml",
-        "CodigoSeguridadeCF": "",
-        "CodigoEstadoValidacionDgii": 0,
-        "CodUsuarioCreador": "Sist",
-    }
-    hints = get_type_hints(Encabezado)
+    def insert(self, table_name: str, columns: list[str], values: list[str]):
+        if self.batch_rows <= 1:
+            self.write(formatear_insert(table_name, columns, [values]))
+            return
 
-    for line in level_0:
-        if line["value"] is None:
-            continue
+        key = (table_name, tuple(columns))
+        rows = self._batches.setdefault(key, [])
+        rows.append(values)
 
-        name = line["name"].split("[")[0].strip()
+        if self.split_bytes:
+            # El INSERT INTO ... VALUES se escribe una vez por cada grupo de filas
+            previos = self._bytes_lotes.get(key) or len(
+                prefijo_insert(table_name, key[1])
+            )
+            self._bytes_lotes[key] = (
+                previos + sum(map(len, values)) + 6 * len(values) + 4
+            )
 
-        if name in hints:
-            encabezado[name] = hints[name](line["value"])
+        if len(rows) >= self.batch_rows:
+            self.flush_inserts(hasta=table_name)
 
-    generar_insert(encabezado, "Comprobantes_Emitidos")
+    def registro(self, table_name: str, data: dict[str, Any]):
+        # Cada registro de procesar_* pasa por aqui; los writers solo cambian
+        # como se guarda en insert_registro
+        plantilla = plantilla_insert(table_name, tuple(data))
+        self.insert_registro(plantilla, [data[key] for key in plantilla.keys])
 
+    def insert_registro(self, plantilla: PlantillaInsert, values: list[Any]):
+        values = [formatear_valor(value) for value in values]
 
-def procesar_forma_pago(lines: list[Line]):
+        if self.batch_rows <= 1:
+            self.write(formatear_fila(plantilla.prefijo, plantilla.table_name, values))
+        else:
+            self.insert(plantilla.table_name, plantilla.columns, values)
+
+    def abrir_transaccion(self):
+        self.write(SQL_INICIO)
+
+    def cerrar_transaccion(self):
+        # Los eNCF que ya no estan en el archivo se borran despues del ultimo
+        # comprobante, aunque la lectura (--jobs, --columnar) haya terminado antes
+        for encf, empresa in self._eliminar_al_final:
+            self.eliminar(encf, empresa)
+
+        self._eliminar_al_final.clear()
+        self._fin_transaccion()
+
+    def _fin_transaccion(self):
+        self.flush_inserts()
+        self.write(SQL_FIN)
+
+    def nuevo_comprobante(self, encf: str):
+        # Los cortes se hacen antes de empezar un comprobante: ninguno queda
+        # repartido en dos transacciones y no quedan bloques vacios al final
+        if self._en_transaccion:
+            rotar = (self.split_every and self._en_archivo >= self.split_every) or (
+                self.split_bytes
+                and self._bytes_archivo + sum(self._bytes_lotes.values())
+                >= self.split_bytes
+            )
 
-    encf = get_encf(lines=lines)
+            if rotar or (
+                self.commit_every and self._en_transaccion >= self.commit_every
+            ):
+                self._fin_transaccion()
+
+                if rotar:
+                    self._rotar()
+                else:
+                    # Cada transaccion declara @errormensage, van en lotes aparte
+                    self.write("\nGO\n\n")
+
+                self.abrir_transaccion()
+                self._en_transaccion = 0
+
+        self._en_transaccion += 1
+        self._en_archivo += 1
+
+        if encf in self._reemplazar:
+            self.eliminar(encf, self._reemplazar.pop(encf))
+
+    def _rotar(self):
+        self.flush()
+        self._file.close()
+        self._numero_archivo += 1
+        self.path = self._nombre_archivo()
+        self.archivos.append(self.path)
+        self._file = self._abrir(self.path)
+        self._en_archivo = 0
+        self._bytes_archivo = 0
+
+    def reemplazar(self, encf: str, empresa: int):
+        # El DELETE se escribe justo antes del comprobante, en su misma
+        # transaccion, aunque la fila se haya leido antes (--jobs)
+        self._reemplazar[encf] = empresa
+
+    def eliminar_al_final(self, encf: str, empresa: int):
+        self._eliminar_al_final.append((encf, empresa))
+
+    def eliminar(self, encf: str, empresa: int):
+        # Borra lo cargado antes para ese eNCF, las tablas hijas primero
+        for table_name in reversed(TABLAS):
+            self.write(
+                f"\nDELETE FROM {table_name} WHERE eNCF = {formatear_valor(encf)} "
+                f"AND CodEmpresa = {empresa}\n"
+            )
 
-    parsed_input: list[FormaPago] = []
-    groups = group_section(lines=lines, start=12, end=26)
-    hints = get_type_hints(FormaPago)
+    def replay(self, items: list[str | tuple]):
+        for item in items:
+            if isinstance(item, str):
+                self.write(item)
+            elif len(item) == 2:
+                self.insert_registro(*item)
+            else:
+                self.insert(*item)
+
+    def _claves_hasta(self, hasta: str | None) -> list[tuple[str, tuple[str, ...]]]:
+        # Se escriben primero las tablas padre para no violar las llaves
+        # foraneas. Con `hasta` solo se vacian las tablas que van antes o
+        # igual que esa, las hijas pueden seguir acumulando filas.
+        limite = len(TABLAS_ORDEN) if hasta is None else TABLAS_ORDEN[hasta]
+
+        return sorted(
+            (key for key in self._batches if TABLAS_ORDEN[key[0]] <= limite),
+            key=lambda key: TABLAS_ORDEN[key[0]],
+        )
 
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
+    def flush_inserts(self, hasta: str | None = None):
+        for key in self._claves_hasta(hasta):
+            table_name, columns = key
+            self.write(formatear_insert(table_name, list(columns), self._batches[key]))
+            del self._batches[key]
+            self._bytes_lotes.pop(key, None)
+
+    @medido
+    def flush(self):
+        if self._pending:
+            self._file.write("".join(self._pending))
+            self._pending.clear()
+            self._pending_size = 0
+
+    def close(self):
+        self.flush_inserts()
+        self.flush()
+        self._file.close()
+        self._publicar()
+
+        if self.split_every or self.split_bytes:
+            self._borrar_partes_sobrantes()
+
+    def _borrar_partes_sobrantes(self):
+        # Si la corrida anterior genero mas partes, las que sobran tendrian
+        # comprobantes viejos al cargar res_*.sql
+        base = self._base
+
+        for path in base.parent.glob(f"{base.stem}_*{base.suffix}"):
+            numero = path.name[len(base.stem) + 1 : len(path.name) - len(base.suffix)]
+
+            if numero.isdigit() and int(numero) > self._numero_archivo:
+                path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._descartar([self._file])
 
-        for line in lines_group:
-            name = line["name"].split("[")[0].strip()
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
+# Guarda en memoria lo que se escribiria en res.sql, para devolverlo desde los
+# procesos de --jobs y repetirlo en el mismo orden en el proceso principal
+class SqlRecorder(SqlWriter):
+    def __init__(self, batch_rows: int = 1, registros: bool = False):
+        self.path = "<memoria>"
+        self.batch_rows = batch_rows
+        self.registros = registros
+        self.items: list[str | tuple] = []
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            parsed_input.append(record)
+    def write(self, text: str):
+        self.items.append(text)
 
-    for forma_pago in parsed_input:
-        generar_insert(forma_pago, "Comprobantes_Emitidos_Formas_Pago")
+    def insert_registro(self, plantilla: PlantillaInsert, values: list[Any]):
+        # Con --bulk o --dsn el registro se devuelve sin formatear como SQL
+        if self.registros:
+            self.items.append((plantilla, values))
+        else:
+            super().insert_registro(plantilla, values)
 
+    def insert(self, table_name: str, columns: list[str], values: list[str]):
+        # Sin --batch la sentencia se formatea aqui, en el proceso hijo
+        if self.batch_rows <= 1:
+            self.items.append(formatear_insert(table_name, columns, [values]))
+        else:
+            self.items.append((table_name, columns, values))
 
-def procesar_telefonos_emisor(lines: list[Line]):
+    def flush_inserts(self, hasta: str | None = None):
+        pass
 
-    encf = get_encf(lines=lines)
-    groups = group_section(lines=lines, start=39, end=42)
-    hints = get_type_hints(TelefonoEmisor)
-    parsed_input: list[TelefonoEmisor] = []
+    def flush(self):
+        pass
 
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
-        for line in lines_group:
-            name = line["name"].split("[")[0].strip()
+    def close(self):
+        pass
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            parsed_input.append(record)
+# Junta los registros de un comprobante tal como salen de procesar_*, sin
+# formatearlos como SQL, para DgiiCasosParser
+class ColectorRegistros(SqlWriter):
+    def __init__(self):
+        self.path = "<memoria>"
+        self.batch_rows = 1
+        self.registros: list[tuple[str, dict[str, Any]]] = []
 
-    for telefono in parsed_input:
-        generar_insert(telefono, "Comprobantes_Emitidos_Telefonos_Emisor")
+    def write(self, text: str):
+        pass
 
+    def registro(self, table_name: str, data: dict[str, Any]):
+        self.registros.append((table_name, data))
 
-def procesar_inpuestos_adicionales(lines: list[Line]):
+    def flush_inserts(self, hasta: str | None = None):
+        pass
 
-    encf = get_encf(lines=lines)
-    groups = group_section(lines=lines, start=119, end=139)
+    def flush(self):
+        pass
 
-    parsed_input: list[InpuestosAdicionales] = []
-    hints = get_type_hints(InpuestosAdicionales)
+    def close(self):
+        pass
 
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
 
-        for line in lines_group:
-            name = line["name"].split("[")[0].strip()
+# Columnas de cada tabla en los archivos de --bulk, en el orden de su TypedDict
+TABLAS_COLUMNAS: dict[str, list[str]] = {
+    table_name: [
+        name if name != "NumeroLineaDoR" else "NumeroLinea"
+        for name in RECORD_CONVERTERS[record_type]
+    ]
+    for table_name, record_type in TABLAS.items()
+}
+
+# Columnas bool de cada tabla, en los archivos de datos van como 1/0
+TABLAS_BOOL: dict[str, set[str]] = {
+    table_name: {
+        name
+        for name, converter in RECORD_CONVERTERS[record_type].items()
+        if converter is to_bool
+    }
+    for table_name, record_type in TABLAS.items()
+}
+
+# Tabs y saltos de linea terminan campos y filas en los archivos de --bulk
+LIMPIAR_BULK = str.maketrans({"\t": " ", "\r": " ", "\n": " ", "\x01": " "})
+
+# Con KEEPNULLS un campo vacio se carga como NULL, asi que el texto vacio se
+# escribe con este marcador y cargar.sql lo vuelve a convertir en ''
+BULK_VACIO = "\x01"
+
+
+# Escribe un archivo de datos separado por tabs y un archivo de formato por
+# tabla, y cargar.sql para cargarlos con OPENROWSET(BULK ...) en el orden de
+# las llaves foraneas
+class BulkWriter(SqlWriter):
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        pipeline: bool = False,
+    ):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pipeline = pipeline
+        self.batch_rows = 1
+        # GETDATE() se resuelve una vez, todos los registros llevan la misma fecha
+        self.fecha_carga = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        self._files: dict[str, Any] = {}
+        self._pending: dict[str, list[str]] = {}
+        self._pending_size = 0
+        self._temporales: list[tuple[str, str]] = []
+        self._eliminar_al_final: list[tuple[str, int]] = []
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+
+    def write(self, text: str):
+        # Los comentarios y la transaccion de res.sql los pone cargar.sql
+        pass
+
+    def nuevo_comprobante(self, encf: str):
+        pass
+
+    def insert_registro(self, plantilla: PlantillaInsert, values: list[Any]):
+        table_name = plantilla.table_name
+        bools = TABLAS_BOOL[table_name]
+        data = dict(zip(plantilla.columns, values))
+        fields = []
+
+        for name in TABLAS_COLUMNAS[table_name]:
+            value = data.get(name)
+
+            if value is None:
+                fields.append("")
+            elif value is FECHA_SERVIDOR:
+                fields.append(self.fecha_carga)
+            elif name in bools:
+                fields.append("1" if value else "0")
+            else:
+                fields.append(str(value).translate(LIMPIAR_BULK) or BULK_VACIO)
+
+        row = "\t".join(fields) + "\r\n"
+        self._pending.setdefault(table_name, []).append(row)
+        self._pending_size += len(row)
+
+        if STATS is not None:
+            STATS.tabla(table_name, 1, len(row), sentencias=0)
+
+        if self._pending_size >= self.buffer_size:
+            self.flush()
+
+    def flush_inserts(self, hasta: str | None = None):
+        pass
+
+    @medido
+    def flush(self):
+        for table_name, rows in self._pending.items():
+            f = self._files.get(table_name)
+
+            if f is None:
+                f = self._files[table_name] = self._abrir(
+                    Path(self.path) / f"{table_name}.dat", encoding="utf-8", newline=""
+                )
+
+            f.write("".join(rows))
+
+        self._pending.clear()
+        self._pending_size = 0
+
+    def close(self):
+        self.flush()
+
+        for f in self._files.values():
+            f.close()
+
+        self._publicar()
+        tablas = [table_name for table_name in TABLAS if table_name in self._files]
+
+        for table_name in tablas:
+            with open(Path(self.path) / f"{table_name}.fmt", "w") as f:
+                f.write(formato_bulk(TABLAS_COLUMNAS[table_name]))
+
+        with open(Path(self.path) / "cargar.sql", "w") as f:
+            f.write(script_bulk(Path(self.path).resolve(), tablas))
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._descartar(list(self._files.values()))
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            parsed_input.append(record)
+def formato_bulk(columns: list[str]) -> str:
+    # Archivo de formato no XML: todo se lee como texto y SQL Server convierte
+    # al tipo de cada columna al insertar
+    lines = ["14.0", str(len(columns))]
 
-    for inpuesto in parsed_input:
-        generar_insert(inpuesto, "Comprobantes_Emitidos_Impuestos_Adicionales")
+    for i, name in enumerate(columns, start=1):
+        terminator = "\\t" if i < len(columns) else "\\r\\n"
+        lines.append(f'{i}\tSQLCHAR\t0\t0\t"{terminator}"\t{i}\t{name}\t""')
 
+    return "\n".join(lines) + "\n"
 
-def procesar_inpuestos_adicionales_otra_moneda(lines: list[Line]):
-    encf = get_encf(lines=lines)
 
-    groups = group_section(lines=lines, start=161, end=181)
+def script_bulk(path: Path, tablas: list[str]) -> str:
+    inserts = []
 
-    parsed_input: list[InpuestosAdicionales] = []
-    hints = get_type_hints(InpuestosAdicionales)
+    # Las columnas se asocian por nombre, asi no depende del orden de las
+    # columnas en la tabla
+    for table_name in tablas:
+        columns = "\n    ,".join(TABLAS_COLUMNAS[table_name])
+        valores = "\n    ,".join(
+            f"IIF({name} = CHAR(1), '', {name}) AS {name}"
+            for name in TABLAS_COLUMNAS[table_name]
+        )
+        inserts.append(f"""\
+INSERT INTO {table_name} WITH (TABLOCK, KEEPNULLS) (
+    {columns}
+)
+SELECT
+    {valores}
+FROM OPENROWSET(
+    BULK '$(DatosDir)\\{table_name}.dat',
+    FORMATFILE = '$(DatosDir)\\{table_name}.fmt',
+    CODEPAGE = '65001'
+) AS datos
+""")
+
+    return f"""\
+-- Correr con sqlcmd o en modo SQLCMD. DatosDir debe ser una ruta que el
+-- servidor pueda leer
+:setvar DatosDir "{path}"
+
+DECLARE @errormensage varchar(max)
+
+BEGIN TRY
+BEGIN TRANSACTION
+
+{"\n".join(inserts)}
+
+COMMIT TRANSACTION
+END TRY
+BEGIN CATCH
+    ROLLBACK TRANSACTION;
+    set @errormensage = ERROR_MESSAGE()
+    RAISERROR(@errormensage,15,217)
+END CATCH
+"""
 
-    for group in groups.keys():
-        lines_group = groups[group]
 
-        record = {}
+# Marcadores de parametros segun el paramstyle del driver DB-API
+PARAMSTYLES: dict[str, Callable[[int], str]] = {
+    "qmark": lambda i: "?",
+    "format": lambda i: "%s",
+    "pyformat": lambda i: "%s",
+    "numeric": lambda i: f":{i + 1}",
+    "named": lambda i: f":p{i}",
+}
 
-        for line in lines_group:
-            name = line["name"].split("[")[0].strip()
+SQLITE_TIPOS = {
+    int: "INTEGER",
+    float: "REAL",
+    bool: "INTEGER",
+    str: "TEXT",
+    Date: "TEXT",
+    DateTime: "TEXT",
+}
 
-            if name in hints:
-                record[name] = hints[name](lines["value"])
+# Una conexion por dsn, se reutiliza entre corridas del mismo proceso
+_CONEXIONES: dict[str, tuple[Any, str]] = {}
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            parsed_input.append(record)
 
-    for inpuesto_otra_moneda in parsed_input:
-        generar_insert(
-            inpuesto_otra_moneda,
-            "Comprobantes_Emitidos_Impuestos_Adicionales_Otra_Moneda",
+def conectar(dsn: str) -> tuple[Any, str]:
+    if dsn in _CONEXIONES:
+        return _CONEXIONES[dsn]
+
+    # sqlite:///ruta.db para pruebas locales, si no una cadena de conexion ODBC
+    if dsn.startswith("sqlite:///"):
+        import sqlite3
+
+        conn = sqlite3.connect(dsn.removeprefix("sqlite:///"))
+        paramstyle = sqlite3.paramstyle
+    else:
+        import pyodbc
+
+        conn = pyodbc.connect(dsn, autocommit=False)
+        paramstyle = pyodbc.paramstyle
+
+    _CONEXIONES[dsn] = (conn, paramstyle)
+
+    return conn, paramstyle
+
+
+def cerrar_conexiones():
+    for conn, _ in _CONEXIONES.values():
+        conn.close()
+
+    _CONEXIONES.clear()
+
+
+def crear_tablas_sqlite(conn: Any):
+    # Tablas con las columnas de las TypedDict, para probar --dsn sin SQL Server
+    for table_name, record_type in TABLAS.items():
+        tipos = get_type_hints(record_type)
+        columns = ", ".join(
+            f"{name} {SQLITE_TIPOS[tipos[field]]}"
+            for name, field in zip(TABLAS_COLUMNAS[table_name], tipos)
         )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})")
+
+
+# Envia los registros directo a la base de datos con executemany por tabla y
+# columnas, todo en una transaccion como la de res.sql
+class DbWriter(SqlWriter):
+    def __init__(
+        self, dsn: str, batch_rows: int = MAX_BATCH_ROWS, commit_every: int = 0
+    ):
+        self.path = dsn
+        self.batch_rows = batch_rows
+        self.commit_every = commit_every
+        self._reemplazar: dict[str, int] = {}
+        self._eliminar_al_final: list[tuple[str, int]] = []
+        self._en_transaccion = 0
+        self.fecha_carga = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        self._conn, paramstyle = conectar(dsn)
+        self._marcador = PARAMSTYLES[paramstyle]
+        self._named = paramstyle == "named"
+        self._batches: dict[tuple[str, tuple[str, ...]], list[list[Any]]] = {}
+        self._sentencias: dict[tuple[str, tuple[str, ...]], str] = {}
+
+    def write(self, text: str):
+        pass
+
+    def insert_registro(self, plantilla: PlantillaInsert, values: list[Any]):
+        table_name = plantilla.table_name
+        bools = TABLAS_BOOL[table_name]
+        params = []
+
+        for name, value in zip(plantilla.columns, values):
+            if value is FECHA_SERVIDOR:
+                value = self.fecha_carga
+            elif name in bools:
+                value = 1 if value else 0
+
+            params.append(value)
+
+        key = (table_name, plantilla.columns)
+        rows = self._batches.setdefault(key, [])
+        rows.append(params)
+
+        if len(rows) >= self.batch_rows:
+            self.flush_inserts(hasta=table_name)
+
+    def nuevo_comprobante(self, encf: str):
+        if self.commit_every and self._en_transaccion >= self.commit_every:
+            self.flush_inserts()
+            self._conn.commit()
+            self._en_transaccion = 0
+
+        self._en_transaccion += 1
+
+        if encf in self._reemplazar:
+            self.eliminar(encf, self._reemplazar.pop(encf))
+
+    def eliminar(self, encf: str, empresa: int):
+        marcadores = self._marcador(0), self._marcador(1)
+        params = [encf, empresa]
+
+        if self._named:
+            params = {"p0": encf, "p1": empresa}
+
+        cursor = self._conn.cursor()
+
+        try:
+            for table_name in reversed(TABLAS):
+                cursor.execute(
+                    f"DELETE FROM {table_name} "
+                    f"WHERE eNCF = {marcadores[0]} AND CodEmpresa = {marcadores[1]}",
+                    params,
+                )
+        finally:
+            cursor.close()
+
+    def _sentencia(self, table_name: str, columns: tuple[str, ...]) -> str:
+        key = (table_name, columns)
+        sql = self._sentencias.get(key)
+
+        if sql is None:
+            marcadores = ", ".join(self._marcador(i) for i in range(len(columns)))
+            sql = self._sentencias[key] = (
+                f"INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({marcadores})"
+            )
 
+        return sql
 
-def procesar_detalle_encabezado(sublines: list[Line], encf: str):
-    groups = group_section(lines=sublines)
+    @medido
+    def flush_inserts(self, hasta: str | None = None):
+        cursor = self._conn.cursor()
 
-    if not groups:
-        return
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
 
-    hints = get_type_hints(DetalleEncabezado)
-    detalle = {}
-    for line in groups[list(groups.keys())[0]]:
+        try:
+            for key in self._claves_hasta(hasta):
+                rows = self._batches.pop(key)
 
-        name = line["name"].split("[")[0].strip()
+                if self._named:
+                    rows = [{f"p{i}": v for i, v in enumerate(row)} for row in rows]
 
-        if name in hints:
-            detalle[name] = hints[name](line["value"])
+                cursor.executemany(self._sentencia(*key), rows)
 
-    if detalle:
-        detalle["eNCF"] = encf
-        detalle["CodEmpresa"] = CODIGO_EMPRESA
+                if STATS is not None:
+                    STATS.tabla(key[0], len(rows), 0)
+        finally:
+            cursor.close()
+
+    def flush(self):
+        pass
 
-        generar_insert(detalle, "Comprobantes_Emitidos_Detalle")
+    def close(self):
+        self.flush_inserts()
+        self._conn.commit()
 
+    def __exit__(self, exc_type, *exc):
+        # Igual que el BEGIN CATCH de res.sql: si algo falla no queda nada
+        if exc_type is None:
+            self.close()
+        else:
+            self._batches.clear()
+            self._conn.rollback()
 
-def procesar_detalle_item(sublines: list[Line], encf: str, numero_linea: int):
 
-    groups = group_section(lines=sublines, start=1, end=11, level=2)
+def celda_texto(cell: str) -> str:
+    return cell.strip()
 
-    parsed_input: list[DetalleItem] = []
-    hints = get_type_hints(DetalleItem)
 
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
+def celda_numero(cell: float) -> str:
+    # Excel guarda los enteros como float, 3.0 -> "3"
+    if cell.is_integer():
+        return str(int(cell))
 
-        for line in lines_group:
+    return str(cell)
 
-            name = line["name"].split("[")[0].strip()
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
+def celda_fecha(cell: datetime) -> str:
+    return cell.strftime("%Y-%m-%d")
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            record["NumeroLinea_Detalle"] = numero_linea
-            parsed_input.append(record)
 
-    for item in parsed_input:
-        generar_insert(item, "Comprobantes_Emitidos_Detalle_Item")
+CONVERTIDORES_CELDA: dict[type, Callable[[Any], str]] = {
+    str: celda_texto,
+    bool: str,
+    int: str,
+    float: celda_numero,
+    datetime: celda_fecha,
+}
 
 
-def procesar_detalle_subcantidad(sublines: list[Line], encf: str, numero_linea: int):
+def normalizar_celda(cell: Any) -> str:
+    if cell is None:
+        return "#e"
 
-    groups = group_section(lines=sublines, start=22, end=32, level=2)
+    return CONVERTIDORES_CELDA.get(type(cell), str)(cell)
 
-    parsed_input: list[DetalleSubcantidad] = []
-    hints = get_type_hints(DetalleSubcantidad)
 
-    for group in groups.keys():
-        lines_group = groups[group]
+@medido
+def load_exel(file_path: str | Path | IO[bytes]) -> Iterator[list[str]]:
+    import openpyxl
+
+    # Load the workbook and select the active worksheet
+    workbook = openpyxl.load_workbook(file_path, data_only=True, read_only=True)
+    sheet = workbook.active
+
+    try:
+        rows = sheet.iter_rows(values_only=True)
+
+        # Get the header row
+        header = next(rows, None)
+
+        if header is None:
+            return
+
+        yield [str(key) for key in header]
+
+        # Tipo y conversor por columna, tomados de la primera celda con valor de
+        # cada columna. Las celdas vacias (la mayoria) no pasan por ningun
+        # conversor y si una celda trae otro tipo que el de su columna se usa
+        # normalizar_celda
+        tipos: list[type | None] = [None] * len(header)
+        convertidores: list[Callable[[Any], str]] = [normalizar_celda] * len(header)
+
+        def inferir(j: int) -> Callable[[Any], str]:
+            def primera(cell: Any) -> str:
+                tipos[j] = type(cell)
+                convertidores[j] = CONVERTIDORES_CELDA.get(type(cell), str)
+                otros[j] = normalizar_celda
+                return normalizar_celda(cell)
+
+            return primera
+
+        otros = [inferir(j) for j in range(len(header))]
+
+        for row in rows:
+            # Filas vacias al final de la hoja
+            if row.count(None) == len(row):
+                continue
+
+            yield [
+                (
+                    "#e"
+                    if cell is None
+                    else convert(cell) if type(cell) is tipo else otro(cell)
+                )
+                for cell, tipo, convert, otro in zip(row, tipos, convertidores, otros)
+            ]
+    finally:
+        workbook.close()
+
+
+@medido
+def read_csv_rows(
+    file: str | Path | IO, delimiter: str = ",", encoding: str = "latin-1"
+) -> Iterator[list[str]]:
+    # La primera fila es el encabezado, el resto se lee a medida que se procesa.
+    # Tambien acepta un archivo ya abierto, de texto o binario, y no lo cierra
+    if isinstance(file, (str, Path)):
+        with open(file, newline="", encoding=encoding) as f:
+            yield from filas_csv(f, delimiter)
+    elif isinstance(file.read(0), str):
+        yield from filas_csv(file, delimiter)
+    else:
+        f = io.TextIOWrapper(file, encoding=encoding, newline="")
 
-        record = {}
+        try:
+            yield from filas_csv(f, delimiter)
+        finally:
+            f.detach()
 
-        for line in lines_group:
 
-            name = line["name"].split("[")[0].strip()
+def filas_csv(f: IO[str], delimiter: str) -> Iterator[list[str]]:
+    for row in csv.reader(f, delimiter=delimiter):
+        if row:
+            yield row
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            record["NumeroLinea_Detalle"] = numero_linea
-            parsed_input.append(record)
+def save_csv(rows: Iterator[list[str]], fname: str = "res.csv") -> Iterator[list[str]]:
+    # Exporta las filas a medida que pasan, solo para depurar la lectura del xlsx
+    with open(fname, "w") as f:
+        for row in rows:
+            f.write("|".join(row) + "\n")
+            yield row
 
-    for subcantidad in parsed_input:
-        generar_insert(subcantidad, "Comprobantes_Emitidos_Detalle_Subcantidad")
 
+def encf_de_fila(row: list[str], col: int) -> str:
+    # Igual que get_encf, pero sobre la fila sin pasar por build_lines
+    value = row[col] if len(row) > col else None
 
-def procesar_detalle_subdescuento(sublines: list[Line], encf: str, numero_linea: int):
+    if value is not None and value.strip() == "#e":
+        value = None
 
-    groups = group_section(lines=sublines, start=42, end=57, level=2)
+    return str(value)
 
-    parsed_input: list[DetalleSubdescuento] = []
-    hints = get_type_hints(DetalleSubdescuento)
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
 
-        for line in lines_group:
+def hash_fila(row: list[str]) -> str:
+    # Solo las celdas con valor, asi una fila mas corta del xlsx da el mismo hash
+    contenido = "\x1f".join(
+        f"{i}\x1e{value}"
+        for i, value in enumerate(row)
+        if value and value.strip() != "#e"
+    )
 
-            name = line["name"].split("[")[0].strip()
+    return hashlib.blake2b(contenido.encode(), digest_size=16).hexdigest()
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            record["NumeroLinea_Detalle"] = numero_linea
-            parsed_input.append(record)
+# Para --incremental: eNCF -> hash de su fila en la corrida anterior y en esta
+class Manifiesto:
+    def __init__(self, path: str):
+        self.path = path
+        self.plantilla = ""
+        self.previo: dict[str, str] = {}
+        self.actual: dict[str, str] = {}
 
-    for subdescuento in parsed_input:
-        generar_insert(subdescuento, "Comprobantes_Emitidos_Detalle_SubDescuento")
+        if Path(path).exists():
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
 
+            self.plantilla = data["plantilla"]
+            self.previo = data["comprobantes"]
 
-def procesar_detalle_subrecargo(sublines: list[Line], encf: str, numero_linea: int):
+    def iniciar(self, header: list[str], empresa: int):
+        plantilla = hash_fila([*header, str(empresa)])
 
-    groups = group_section(lines=sublines, start=58, end=73, level=2)
+        # Con otra plantilla u otra empresa ninguna fila cuenta como igual,
+        # pero los eNCF anteriores se siguen considerando ya cargados
+        if plantilla != self.plantilla:
+            self.previo = dict.fromkeys(self.previo, "")
 
-    parsed_input: list[DetalleSubrecargo] = []
-    hints = get_type_hints(DetalleSubrecargo)
-    for group in groups.keys():
-        lines_group = groups[group]
+        self.plantilla = plantilla
 
-        record = {}
+    def guardar(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"plantilla": self.plantilla, "comprobantes": self.actual}, f)
 
-        for line in lines_group:
 
-            name = line["name"].split("[")[0].strip()
+def filtrar_incremental(
+    rows: Iterator[list[str]],
+    manifiesto: Manifiesto,
+    out: SqlWriter,
+    delta: bool,
+    empresa: int,
+) -> Iterator[list[str]]:
+    header = next(rows, None)
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
+    if header is None:
+        return
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            record["NumeroLinea_Detalle"] = numero_linea
-            parsed_input.append(record)
+    manifiesto.iniciar(header, empresa)
+    yield header
 
-    for subrecargo in parsed_input:
-        generar_insert(subrecargo, "Comprobantes_Emitidos_Detalle_SubRecargo")
+    col_encf = compile_schema(header).layout.encf
+    omitidas = 0
 
+    for row in rows:
+        eNCF = encf_de_fila(row, col_encf)
+        digest = hash_fila(row)
+        anterior = manifiesto.previo.get(eNCF)
+        manifiesto.actual[eNCF] = digest
 
-def procesar_detalle_impuestos_adicionales(
-    sublines: list[Line], encf: str, numero_linea: int
-):
+        if anterior == digest:
+            omitidas += 1
+            continue
 
-    groups = group_section(lines=sublines, start=73, end=75, level=2)
+        if delta and anterior is not None:
+            out.reemplazar(eNCF, empresa)
 
-    parsed_input: list[DetalleInpuestosAdicionales] = []
-    hints = get_type_hints(DetalleInpuestosAdicionales)
-    for group in groups.keys():
-        lines_group = groups[group]
-        record = {}
+        yield row
 
-        for line in lines_group:
+    # Los eNCF que ya no estan en el archivo tambien se borran
+    if delta:
+        for eNCF in sorted(manifiesto.previo.keys() - manifiesto.actual.keys()):
+            out.eliminar_al_final(eNCF, empresa)
 
-            name = line["name"].split("[")[0].strip()
+    print(f"Skipped {omitidas} unchanged comprobantes")
 
-            if name in hints:
-                record[name] = hints[name](line["value"])
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
-            record["NumeroLinea_Detalle"] = numero_linea
-            parsed_input.append(record)
+# Schemas ya compilados por encabezado, se reutilizan entre archivos (lotes y
+# --watch) mientras el proceso siga abierto
+_SCHEMAS: dict[tuple[str, ...], Schema] = {}
 
-    for impuesto in parsed_input:
-        generar_insert(impuesto, "Comprobantes_Emitidos_Detalle_Impuestos_Adicionales")
+# Los procesos de --jobs no repiten el aviso de columnas sueltas
+_AVISAR_SUELTAS = True
 
 
-def procesar_detalle(lines: list[Line]):
-    encf = get_encf(lines=lines)
+@medido
+def compile_schema(keys: list[str]) -> Schema:
+    # El encabezado no cambia entre filas, se separa una sola vez por archivo.
+    # "CodigoItem[3][2]" -> base "CodigoItem", level 2, groups (3, 2)
+    schema = _SCHEMAS.get(tuple(keys))
 
-    groups = group_section(lines=lines, start=182, end=5142, ignore_none=False)
+    if schema is not None:
+        return schema
 
-    for group in groups.keys():
-        lines_group = groups[group]
+    columns = []
 
-        numero_linea = get_numero_linea_det(lines=lines_group)
+    for i, key in enumerate(keys):
+        parts = key.split("[")
+        groups = tuple(int(part.split("]")[0]) for part in parts[1:])
 
-        if numero_linea is not None:
-            procesar_detalle_encabezado(sublines=lines_group, encf=encf)
-            procesar_detalle_item(
-                sublines=lines_group, encf=encf, numero_linea=numero_linea
-            )
-            procesar_detalle_subcantidad(
-                sublines=lines_group, encf=encf, numero_linea=numero_linea
-            )
-            procesar_detalle_subdescuento(
-                sublines=lines_group, encf=encf, numero_linea=numero_linea
-            )
-            procesar_detalle_subrecargo(
-                sublines=lines_group, encf=encf, numero_linea=numero_linea
-            )
-            procesar_detalle_impuestos_adicionales(
-                sublines=lines_group, encf=encf, numero_linea=numero_linea
+        columns.append(
+            Column(
+                name=key,
+                base=parts[0].strip(),
+                level=len(parts) - 1,
+                groups=groups,
+                origin_col=i,
             )
+        )
 
+    layout = compile_layout(columns)
+    rutas = compile_rutas(columns, layout)
+    bloques_detalle = [
+        BloqueDetalle(
+            col_numero_linea=linea.inicio,
+            rutas=compile_rutas_detalle(columns, linea),
+        )
+        for linea in layout.detalle
+    ]
 
-def procesar_descuento_recargo(lines: list[Line]):
-    encf = get_encf(lines=lines)
+    con_ruta = {ruta.origin_col for ruta in rutas}
+    con_ruta.update(ruta.origin_col for b in bloques_detalle for ruta in b.rutas)
+    sueltas = [
+        column.name
+        for column in columns
+        if column.level >= 1
+        and column.origin_col not in con_ruta
+        and column.base not in CAMPOS_SIN_TABLA
+    ]
 
-    groups = group_section(lines=lines, start=5157, end=5175)
+    # Una columna nueva o mal escrita no se pierde sin avisar
+    if sueltas and _AVISAR_SUELTAS:
+        print(
+            f"AVISO: {len(sueltas)} columnas con indices no van a ninguna tabla: "
+            + ", ".join(sueltas[:8])
+            + (", ..." if len(sueltas) > 8 else ""),
+            file=sys.stderr,
+        )
 
-    parsed_input: list[DescuentoRecargo] = []
-    hints = get_type_hints(DescuentoRecargo)
-    for group in groups.keys():
-        lines_group = groups[group]
+    schema = _SCHEMAS[tuple(keys)] = Schema(
+        columns=columns,
+        rutas=rutas,
+        bloques_detalle=bloques_detalle,
+        sueltas=sueltas,
+        layout=layout,
+    )
 
-        record = {}
+    return schema
 
-        for line in lines_group:
 
-            name = line["name"].split("[")[0].strip()
-            if name in hints:
-                record[name] = hints[name](line["value"])
+def _extender(secciones: dict[str, list], tabla: str, col: int, grupo: int):
+    seccion = secciones.get(tabla)
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
+    if seccion is None:
+        secciones[tabla] = [col, col + 1, {grupo: None}]
+    else:
+        seccion[1] = col + 1
+        seccion[2][grupo] = None
 
-            parsed_input.append(record)
 
-    for descuento_o_recargo in parsed_input:
-        generar_insert(
-            descuento_o_recargo,
-            "Comprobantes_Emitidos_Descuento_Recargo",
+def _secciones(secciones: dict[str, list]) -> dict[str, Seccion]:
+    return {
+        tabla: Seccion(inicio, fin, tuple(grupos))
+        for tabla, (inicio, fin, grupos) in secciones.items()
+    }
+
+
+def compile_layout(columns: list[Column]) -> Layout:
+    # Un solo recorrido por el encabezado. Una linea de detalle empieza en
+    # NumeroLinea[n] y sigue mientras las columnas tengan ese [n], aunque sean
+    # campos que no se conocen. Termina en otro indice o en un campo [n] del
+    # encabezado (con una sola linea, los subtotales, Descuento/Recargo y
+    # Paginacion tambien empiezan en [1]). El resto de las columnas [n] va a la
+    # tabla que tiene ese campo. Asi, si la DGII agrega o mueve columnas, las
+    # secciones se mueven con ellas
+    claves: dict[str, int] = {}
+    secciones: dict[str, list] = {}
+    lineas: list[list] = []
+    linea = None
+
+    for column in columns:
+        col = column.origin_col
+
+        if column.level == 0:
+            claves.setdefault(column.base, col)
+            linea = None
+            continue
+
+        if column.level == 1 and column.base == "NumeroLinea":
+            linea = [column.groups[0], col, col + 1, {}]
+            lineas.append(linea)
+            continue
+
+        if (
+            linea is not None
+            and column.groups[0] == linea[0]
+            and not (
+                column.level == 1
+                and (column.base in CAMPOS_SECCIONES or column.base in CAMPOS_SIN_TABLA)
+            )
+        ):
+            linea[2] = col + 1
+            tabla = CAMPOS_DETALLE.get(column.base)
+
+            if column.level >= 2 and tabla is not None:
+                _extender(linea[3], tabla, col, column.groups[1])
+
+            continue
+
+        # Las columnas [n][m] fuera de su linea no van a ninguna seccion
+        linea = None
+        tabla = CAMPOS_SECCIONES.get(column.base)
+
+        if column.level == 1 and tabla is not None:
+            _extender(secciones, tabla, col, column.groups[0])
+
+    for name in ("TipoeCF", "eNCF", "MontoTotal"):
+        if name not in claves:
+            raise ValueError(f"La plantilla no tiene la columna {name}")
+
+    return Layout(
+        # La primera columna sin indices es el nombre del caso de prueba
+        nombre_archivo=next(c.origin_col for c in columns if c.level == 0),
+        tipo_ecf=claves["TipoeCF"],
+        encf=claves["eNCF"],
+        monto_total=claves["MontoTotal"],
+        secciones=_secciones(secciones),
+        detalle=[
+            LineaDetalle(numero, inicio, fin, _secciones(secciones_linea))
+            for numero, inicio, fin, secciones_linea in lineas
+        ],
+    )
+
+
+def imprimir_layout(schema: Schema):
+    layout = schema.layout
+
+    print(
+        f"{len(schema.columns)} columnas, TipoeCF={layout.tipo_ecf} "
+        f"eNCF={layout.encf} MontoTotal={layout.monto_total}\n"
+    )
+    print(f"{'Seccion':<58}{'columnas':^14}{'grupos':>8}")
+
+    for tabla, seccion in layout.secciones.items():
+        print(
+            f"{tabla:<58}{seccion.inicio:>7}-{seccion.fin - 1:<6}"
+            f"{len(seccion.grupos):>8}"
         )
 
+    if layout.detalle:
+        primera = layout.detalle[0]
+        print(
+            f"\nDetalle: {len(layout.detalle)} lineas de {primera.fin - primera.inicio} "
+            f"columnas, {primera.inicio}-{layout.detalle[-1].fin - 1}"
+        )
 
-def procesar_paginacion(lines: list[Line]):
-    encf = get_encf(lines=lines)
+        # Relativas al inicio de la linea, igual en todas
+        for tabla, seccion in primera.secciones.items():
+            print(
+                f"  {tabla:<56}{seccion.inicio - primera.inicio:>7}-"
+                f"{seccion.fin - 1 - primera.inicio:<6}{len(seccion.grupos):>8}"
+            )
 
-    groups = group_section(lines=lines, start=5175, end=5210)
+    if schema.sueltas:
+        sueltas = schema.sueltas
+        print(f"\nColumnas con indices que no van a ninguna tabla: {len(sueltas)}")
+        print("  " + ", ".join(sueltas[:8]) + (", ..." if len(sueltas) > 8 else ""))
 
-    parsed_input: list[Paginacion] = []
 
-    hints = get_type_hints(Paginacion)
+def _ruta(column: Column, tabla: str, grupo: int) -> Ruta | None:
+    converter = RECORD_CONVERTERS[TABLAS[tabla]].get(column.base)
 
-    for group in groups.keys():
-        lines_group = groups[group]
+    if converter is None:
+        return None
 
-        record = {}
-        for line in lines_group:
+    return Ruta(column.origin_col, tabla, grupo, column.base, converter)
 
-            name = line["name"].split("[")[0].strip()
 
-            if name in hints:
-                record[name] = hints(name)(line["value"])
+def compile_rutas(columns: list[Column], layout: Layout) -> list[Ruta]:
+    rutas = []
 
-        if record:
-            record["eNCF"] = encf
-            record["CodEmpresa"] = CODIGO_EMPRESA
+    for column in columns:
+        if column.level == 0:
+            rutas.append(_ruta(column, "Comprobantes_Emitidos", 0))
 
-            parsed_input.append(record)
+    for tabla, seccion in layout.secciones.items():
+        for column in columns[seccion.inicio : seccion.fin]:
+            if column.level >= 1:
+                rutas.append(_ruta(column, tabla, column.groups[0]))
 
-    for pagina in parsed_input:
-        generar_insert(pagina, "Comprobantes_Emitidos_Paginacion")
+    return [ruta for ruta in rutas if ruta is not None]
 
 
-def main():
-    global CODIGO_EMPRESA
+def compile_rutas_detalle(columns: list[Column], linea: LineaDetalle) -> list[Ruta]:
+    rutas = [
+        _ruta(column, "Comprobantes_Emitidos_Detalle", 0)
+        for column in columns[linea.inicio : linea.fin]
+        if column.level == 1
+    ]
 
-    parser = argparse.ArgumentParser(
-        prog="Herramienta de transformacion DGII",
-        description="Transforma archivos csv en sentensias insert en sql de acuerdo a la documentacion de la DGII.",
-    )
+    for tabla, seccion in linea.secciones.items():
+        for column in columns[seccion.inicio : seccion.fin]:
+            if column.level >= 2:
+                rutas.append(_ruta(column, tabla, column.groups[1]))
 
-    parser.add_argument("filepath", type=str)
+    return [ruta for ruta in rutas if ruta is not None]
 
-    parser.add_argument("-e", "--empresa", type=int, default=1)
 
-    args = parser.parse_args()
+@medido
+def build_lines(schema: Schema, row: list[Any]) -> Lines:
+    if len(row) < len(schema.columns):
+        row = row + ["#e"] * (len(schema.columns) - len(row))
 
-    path_input = args.filepath
+    values = [
+        None if value is not None and value.strip() == "#e" else value
+        for value in row[: len(schema.columns)]
+    ]
 
-    CODIGO_EMPRESA = args.empresa
+    return Lines(values, schema.layout)
 
-    if path_input.endswith(".xlsx"):
-        print("Loading data from excel file...")
-        data = load_exel(path_input)
 
-        print("Saving parsed excel file into a csv file\n")
-        path_input = save_csv(data)
+def get_encf(lines: Lines):
+    return str(lines.values[lines.layout.encf])
 
-    filepath = Path(path_input)
 
-    if not filepath.exists():
-        print("ERROR: El archivo no existe.")
-        return
+def get_numero_linea_det(value: str | None):
+    try:
+        return int(value)
+    except Exception:
+        return None
 
-    if not path_input.endswith(".csv"):
-        print("ERROR: El archivo no es un archivo .csv")
-        return
 
-    data = read_csv_as_dicts(file=filepath, delimiter="|")
+def _agregar(
+    secciones: dict[str, dict[int, dict[str, Any]]],
+    lines: Lines,
+    rutas: list[Ruta],
+):
+    values = lines.values
+
+    for ruta in rutas:
+        value = values[ruta.origin_col]
 
-    lines = []
+        if value is None:
+            continue
 
-    keys = [key for key in data[0].keys()]
+        grupos = secciones[ruta.tabla]
+        record = grupos.get(ruta.grupo)
 
-    with open("res.sql", "w") as f:
-        f.write(
-            """\
-DECLARE @errormensage varchar(max)
+        if record is None:
+            record = grupos[ruta.grupo] = {}
 
-BEGIN TRY
-BEGIN TRANSACTION
+        record[ruta.campo] = ruta.converter(value)
 
-"""
-        )
 
-    for index, row in enumerate(data):
-        lines.clear()
+@medido
+def despachar(lines: Lines, schema: Schema, empresa: int) -> Registros:
+    # Un solo recorrido por las columnas con ruta de la fila: cada valor va
+    # directo al registro de su tabla y grupo
+    secciones = {tabla: {} for tabla in TABLAS}
+    _agregar(secciones, lines, schema.rutas)
 
-        for i, key in enumerate(keys):
-            number_of_levels = len(key.split("[")) - 1
+    values = lines.values
+    detalle = []
 
-            value = row[key]
+    for bloque in schema.bloques_detalle:
+        # Solo se recorren las lineas de detalle que tienen NumeroLinea, las
+        # demas se saltan sin tocar sus columnas
+        if values[bloque.col_numero_linea] is None:
+            continue
 
-            if value.strip() == "#e":
-                value = None
+        numero_linea = get_numero_linea_det(values[bloque.col_numero_linea])
 
-            lines.append(
-                Line(name=key, value=value, level=number_of_levels, origin_col=i)
-            )
+        if numero_linea is None:
+            continue
 
-        eNCF = get_encf(lines)
+        secciones_detalle = {tabla: {} for tabla in TABLAS_DETALLE}
+        secciones_detalle["Comprobantes_Emitidos_Detalle"] = {}
+        _agregar(secciones_detalle, lines, bloque.rutas)
 
-        print(f"Generating ({index + 1}) {eNCF=}")
+        detalle.append((numero_linea, secciones_detalle))
 
-        with open("res.sql", "a") as f:
-            f.write("-- " + "=" * 80)
-            f.write(f" -- Transaccon {index + 1}, {eNCF=} --\n")
+    layout = lines.layout
+    nombre_archivo = values[layout.nombre_archivo]
 
-        procesar_encabezado(lines)
-        procesar_forma_pago(lines)
-        procesar_telefonos_emisor(lines)
-        procesar_inpuestos_adicionales(lines)
-        procesar_inpuestos_adicionales_otra_moneda(lines)
-        procesar_detalle(lines)
-        procesar_descuento_recargo(lines)
-        procesar_paginacion(lines)
+    # Si tipo ecf = 32 y montototal < 250000 true else false
+    enviar_a_dgii_por_resumen = (
+        int(values[layout.tipo_ecf]) == 32
+        and float(values[layout.monto_total]) < 250_000
+    )
 
-    with open("res.sql", "a") as f:
-        f.write(
-            """\
+    return Registros(
+        encf=get_encf(lines),
+        empresa=empresa,
+        nombre_archivo=str(nombre_archivo),
+        enviar_a_dgii_por_resumen=enviar_a_dgii_por_resumen,
+        secciones=secciones,
+        detalle=detalle,
+    )
 
 
-COMMIT TRANSACTION
-END TRY
-BEGIN CATCH
-    ROLLBACK TRANSACTION;
-    set @errormensage = ERROR_MESSAGE()
-    RAISERROR(@errormensage,15,217)
-END CATCH"""
-        )
+@medido
+def iter_registros_columnar(
+    rows: Iterator[list[Any]], empresa: int
+) -> Iterator[Registros]:
+    # Carga todo el archivo en columnas y calcula nulos, conversiones numericas
+    # y EnviaraDgiiPorResumen para todas las filas a la vez. Con NumPy se hace
+    # sobre arreglos; sin NumPy se usan listas por columna con el mismo resultado
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
 
-    print("Done!\n")
+    header = next(rows, None)
+
+    if header is None:
+        return
+
+    schema = compile_schema(header)
+    width = len(schema.columns)
+
+    filas = [row[:width] + ["#e"] * (width - len(row)) for row in rows]
+
+    if not filas:
+        return
+
+    if np is not None:
+        datos = np.array(filas, dtype=object)
+        del filas
+
+        nulos = datos == "#e"
+
+        # "#e" con espacios alrededor tambien es nulo
+        for j in np.flatnonzero(~nulos.all(axis=0)):
+            columna = datos[:, j]
+            nulos[:, j] |= [value.strip() == "#e" for value in columna]
+
+        columnas = datos.T
+    else:
+        columnas = list(zip(*filas))
+        del filas
+
+        nulos_columnas = [[value.strip() == "#e" for value in c] for c in columnas]
+        nulos = list(zip(*nulos_columnas))
+
+    n = len(columnas[0])
+
+    def convertir(j: int, converter: Callable[[Any], Any]) -> list[Any]:
+        columna = columnas[j]
+
+        if np is not None and converter in (float, to_int):
+            vivos = ~nulos[:, j]
+            convertidos = np.full(n, None, dtype=object)
+
+            try:
+                tipo = np.float64 if converter is float else np.int64
+                convertidos[vivos] = columna[vivos].astype(tipo).tolist()
+            except (ValueError, OverflowError):
+                convertidos[vivos] = [converter(value) for value in columna[vivos]]
+
+            return convertidos.tolist()
+
+        if np is not None:
+            vivos_columna = (~nulos[:, j]).tolist()
+        else:
+            vivos_columna = [not nulos[i][j] for i in range(n)]
+
+        return [
+            converter(value) if vivo else None
+            for value, vivo in zip(columna, vivos_columna)
+        ]
+
+    # columna -> [(ruta, indice del bloque de detalle o None)]
+    rutas_por_columna: dict[int, list[tuple[Ruta, int | None]]] = {}
+
+    for ruta in schema.rutas:
+        rutas_por_columna.setdefault(ruta.origin_col, []).append((ruta, None))
+
+    for b, bloque in enumerate(schema.bloques_detalle):
+        for ruta in bloque.rutas:
+            rutas_por_columna.setdefault(ruta.origin_col, []).append((ruta, b))
+
+    convertidos = {
+        (ruta.origin_col, ruta.converter): convertir(ruta.origin_col, ruta.converter)
+        for rutas in rutas_por_columna.values()
+        for ruta, _ in rutas
+    }
+
+    numeros_linea = [
+        [
+            get_numero_linea_det(value) if value is not None else None
+            for value in convertir(bloque.col_numero_linea, str)
+        ]
+        for bloque in schema.bloques_detalle
+    ]
+
+    layout = schema.layout
+    nombre_archivo = layout.nombre_archivo
+    tipos_ecf = columnas[layout.tipo_ecf]
+    montos = columnas[layout.monto_total]
+
+    if np is not None:
+        resumen = (tipos_ecf.astype(np.int64) == 32) & (
+            montos.astype(np.float64) < 250_000
+        )
+        no_nulos = [np.flatnonzero(~fila).tolist() for fila in nulos]
+    else:
+        resumen = [
+            int(tipo) == 32 and float(monto) < 250_000
+            for tipo, monto in zip(tipos_ecf, montos)
+        ]
+        no_nulos = [[j for j, nulo in enumerate(fila) if not nulo] for fila in nulos]
+
+    for i in range(n):
+        secciones = {tabla: {} for tabla in TABLAS}
+        bloques: dict[int, dict[str, dict[int, dict[str, Any]]]] = {}
+
+        # Solo se visitan las celdas con valor de la fila
+        for j in no_nulos[i]:
+            for ruta, b in rutas_por_columna.get(j, ()):
+                if b is None:
+                    destino = secciones
+                elif numeros_linea[b][i] is None:
+                    continue
+                else:
+                    destino = bloques.get(b)
+
+                    if destino is None:
+                        destino = bloques[b] = {tabla: {} for tabla in TABLAS_DETALLE}
+                        destino["Comprobantes_Emitidos_Detalle"] = {}
+
+                grupos = destino[ruta.tabla]
+                record = grupos.get(ruta.grupo)
+
+                if record is None:
+                    record = grupos[ruta.grupo] = {}
+
+                record[ruta.campo] = convertidos[(j, ruta.converter)][i]
+
+        yield Registros(
+            encf=str(columnas[layout.encf][i] if not nulos[i][layout.encf] else None),
+            empresa=empresa,
+            nombre_archivo=str(
+                columnas[nombre_archivo][i] if not nulos[i][nombre_archivo] else None
+            ),
+            enviar_a_dgii_por_resumen=bool(resumen[i]),
+            secciones=secciones,
+            detalle=[(numeros_linea[b][i], bloques[b]) for b in sorted(bloques)],
+        )
+
+
+_PREFIJOS: dict[tuple[str, tuple[str, ...]], str] = {}
+_PLANTILLAS: dict[tuple[str, tuple[str, ...]], PlantillaInsert] = {}
+
+
+def prefijo_insert(table_name: str, columns: tuple[str, ...]) -> str:
+    key = (table_name, columns)
+    prefijo = _PREFIJOS.get(key)
+
+    if prefijo is None:
+        prefijo = _PREFIJOS[key] = (
+            f"\nINSERT INTO {table_name}(\n    {"\n    ,".join(columns)}\n)\nVALUES (\n"
+        )
+
+    return prefijo
+
+
+def plantilla_insert(table_name: str, keys: tuple[str, ...]) -> PlantillaInsert:
+    # Los registros de una tabla casi siempre traen las mismas llaves, asi que
+    # el orden y el cambio de nombre se resuelven una sola vez
+    key = (table_name, keys)
+    plantilla = _PLANTILLAS.get(key)
+
+    if plantilla is None:
+        nombres = {k: k if k != "NumeroLineaDoR" else "NumeroLinea" for k in keys}
+        ordered = tuple(sorted(keys, key=nombres.__getitem__))
+        columns = tuple(nombres[k] for k in ordered)
+
+        plantilla = _PLANTILLAS[key] = PlantillaInsert(
+            table_name=table_name,
+            keys=ordered,
+            columns=columns,
+            prefijo=prefijo_insert(table_name, columns),
+        )
+
+    return plantilla
+
+
+def formatear_valor(value: Any) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+
+    # Los campos bit se insertan como 'True'/'False'
+    if value is True or value is False:
+        return f"'{value}'"
+
+    if value is FECHA_SERVIDOR:
+        return "GETDATE()"
+
+    return str(value)
+
+
+def formatear_fila(prefijo: str, table_name: str, values: list[str]) -> str:
+    sql = f"{prefijo}    {"\n    ,".join(values)}\n)\n\n"
+
+    if STATS is not None:
+        STATS.tabla(table_name, 1, len(sql))
+
+    return sql
+
+
+@medido
+def formatear_insert(table_name: str, columns: list[str], rows: list[list[str]]) -> str:
+    values = "\n)\n,(\n".join(f"    {"\n    ,".join(row)}" for row in rows)
+    sql = f"{prefijo_insert(table_name, tuple(columns))}{values}\n)\n\n"
+
+    if STATS is not None:
+        STATS.tabla(table_name, len(rows), len(sql))
+
+    return sql
+
+
+@medido
+def generar_insert(data: dict[str, Any], table_name: str, out: SqlWriter):
+    out.registro(table_name, data)
+
+
+@medido
+def procesar_encabezado(registros: Registros, out: SqlWriter):
+    encabezado: Encabezado = {
+        "CodEmpresa": registros.empresa,
+        "FechaHoraFirma": FECHA_SERVIDOR,
+        "FechaCreacion": FECHA_SERVIDOR,
+        "Estatus": True,
+        "EnviaraDgiiPorResumen": registros.enviar_a_dgii_por_resumen,
+        "EnviarAReceptor": False,
+        "EstatusEnvioDgii": "Pendiente",
+        "EstatusEnvioReceptor": "Pendiente",
+        "NombreDispositivoCreador": "Interno",
+        "CantidadIntentosEnviosDgii": 0,
+        "CantidadIntentosEnviosReceptor": 0,
+        "NombreArchivo": registros.nombre_archivo + ".xml",
+        "CodigoSeguridadeCF": "",
+        "CodigoEstadoValidacionDgii": 0,
+        "CodUsuarioCreador": "Sist",
+    }
+
+    for record in registros.secciones["Comprobantes_Emitidos"].values():
+        encabezado.update(record)
+
+    generar_insert(encabezado, "Comprobantes_Emitidos", out)
+
+
+@medido
+def procesar_forma_pago(registros: Registros, encf: str, out: SqlWriter):
+    grupos = registros.secciones["Comprobantes_Emitidos_Formas_Pago"]
+    parsed_input: list[FormaPago] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for forma_pago in parsed_input:
+        generar_insert(forma_pago, "Comprobantes_Emitidos_Formas_Pago", out)
+
+
+@medido
+def procesar_telefonos_emisor(registros: Registros, encf: str, out: SqlWriter):
+    grupos = registros.secciones["Comprobantes_Emitidos_Telefonos_Emisor"]
+    parsed_input: list[TelefonoEmisor] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for telefono in parsed_input:
+        generar_insert(telefono, "Comprobantes_Emitidos_Telefonos_Emisor", out)
+
+
+@medido
+def procesar_inpuestos_adicionales(registros: Registros, encf: str, out: SqlWriter):
+    grupos = registros.secciones["Comprobantes_Emitidos_Impuestos_Adicionales"]
+    parsed_input: list[InpuestosAdicionales] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for inpuesto in parsed_input:
+        generar_insert(inpuesto, "Comprobantes_Emitidos_Impuestos_Adicionales", out)
+
+
+@medido
+def procesar_inpuestos_adicionales_otra_moneda(
+    registros: Registros, encf: str, out: SqlWriter
+):
+    grupos = registros.secciones[
+        "Comprobantes_Emitidos_Impuestos_Adicionales_Otra_Moneda"
+    ]
+    parsed_input: list[InpuestosAdicionalesOtraMoneda] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for inpuesto_otra_moneda in parsed_input:
+        generar_insert(
+            inpuesto_otra_moneda,
+            "Comprobantes_Emitidos_Impuestos_Adicionales_Otra_Moneda",
+            out,
+        )
+
+
+@medido
+def procesar_detalle_encabezado(
+    grupos: dict[int, dict[str, Any]], encf: str, empresa: int, out: SqlWriter
+):
+    for detalle in grupos.values():
+        detalle["eNCF"] = encf
+        detalle["CodEmpresa"] = empresa
+
+        generar_insert(detalle, "Comprobantes_Emitidos_Detalle", out)
+
+
+@medido
+def procesar_detalle_item(
+    grupos: dict[int, dict[str, Any]],
+    encf: str,
+    empresa: int,
+    numero_linea: int,
+    out: SqlWriter,
+):
+    parsed_input: list[DetalleItem] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = empresa
+        record["NumeroLinea_Detalle"] = numero_linea
+        parsed_input.append(record)
+
+    for item in parsed_input:
+        generar_insert(item, "Comprobantes_Emitidos_Detalle_Item", out)
+
+
+@medido
+def procesar_detalle_subcantidad(
+    grupos: dict[int, dict[str, Any]],
+    encf: str,
+    empresa: int,
+    numero_linea: int,
+    out: SqlWriter,
+):
+    parsed_input: list[DetalleSubcantidad] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = empresa
+        record["NumeroLinea_Detalle"] = numero_linea
+        parsed_input.append(record)
+
+    for subcantidad in parsed_input:
+        generar_insert(subcantidad, "Comprobantes_Emitidos_Detalle_Subcantidad", out)
+
+
+@medido
+def procesar_detalle_subdescuento(
+    grupos: dict[int, dict[str, Any]],
+    encf: str,
+    empresa: int,
+    numero_linea: int,
+    out: SqlWriter,
+):
+    parsed_input: list[DetalleSubdescuento] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = empresa
+        record["NumeroLinea_Detalle"] = numero_linea
+        parsed_input.append(record)
+
+    for subdescuento in parsed_input:
+        generar_insert(subdescuento, "Comprobantes_Emitidos_Detalle_SubDescuento", out)
+
+
+@medido
+def procesar_detalle_subrecargo(
+    grupos: dict[int, dict[str, Any]],
+    encf: str,
+    empresa: int,
+    numero_linea: int,
+    out: SqlWriter,
+):
+    parsed_input: list[DetalleSubrecargo] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = empresa
+        record["NumeroLinea_Detalle"] = numero_linea
+        parsed_input.append(record)
+
+    for subrecargo in parsed_input:
+        generar_insert(subrecargo, "Comprobantes_Emitidos_Detalle_SubRecargo", out)
+
+
+@medido
+def procesar_detalle_impuestos_adicionales(
+    grupos: dict[int, dict[str, Any]],
+    encf: str,
+    empresa: int,
+    numero_linea: int,
+    out: SqlWriter,
+):
+    parsed_input: list[DetalleInpuestosAdicionales] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = empresa
+        record["NumeroLinea_Detalle"] = numero_linea
+        parsed_input.append(record)
+
+    for impuesto in parsed_input:
+        generar_insert(
+            impuesto, "Comprobantes_Emitidos_Detalle_Impuestos_Adicionales", out
+        )
+
+
+@medido
+def procesar_detalle(registros: Registros, encf: str, out: SqlWriter):
+    for numero_linea, secciones in registros.detalle:
+        procesar_detalle_encabezado(
+            grupos=secciones["Comprobantes_Emitidos_Detalle"],
+            encf=encf,
+            empresa=registros.empresa,
+            out=out,
+        )
+        procesar_detalle_item(
+            grupos=secciones["Comprobantes_Emitidos_Detalle_Item"],
+            encf=encf,
+            empresa=registros.empresa,
+            numero_linea=numero_linea,
+            out=out,
+        )
+        procesar_detalle_subcantidad(
+            grupos=secciones["Comprobantes_Emitidos_Detalle_Subcantidad"],
+            encf=encf,
+            empresa=registros.empresa,
+            numero_linea=numero_linea,
+            out=out,
+        )
+        procesar_detalle_subdescuento(
+            grupos=secciones["Comprobantes_Emitidos_Detalle_SubDescuento"],
+            encf=encf,
+            empresa=registros.empresa,
+            numero_linea=numero_linea,
+            out=out,
+        )
+        procesar_detalle_subrecargo(
+            grupos=secciones["Comprobantes_Emitidos_Detalle_SubRecargo"],
+            encf=encf,
+            empresa=registros.empresa,
+            numero_linea=numero_linea,
+            out=out,
+        )
+        procesar_detalle_impuestos_adicionales(
+            grupos=secciones["Comprobantes_Emitidos_Detalle_Impuestos_Adicionales"],
+            encf=encf,
+            empresa=registros.empresa,
+            numero_linea=numero_linea,
+            out=out,
+        )
+
+
+@medido
+def procesar_descuento_recargo(registros: Registros, encf: str, out: SqlWriter):
+    grupos = registros.secciones["Comprobantes_Emitidos_Descuento_Recargo"]
+    parsed_input: list[DescuentoRecargo] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for descuento_o_recargo in parsed_input:
+        generar_insert(
+            descuento_o_recargo, "Comprobantes_Emitidos_Descuento_Recargo", out
+        )
+
+
+@medido
+def procesar_paginacion(registros: Registros, encf: str, out: SqlWriter):
+    grupos = registros.secciones["Comprobantes_Emitidos_Paginacion"]
+    parsed_input: list[Paginacion] = []
+
+    for record in grupos.values():
+        record["eNCF"] = encf
+        record["CodEmpresa"] = registros.empresa
+        parsed_input.append(record)
+
+    for pagina in parsed_input:
+        generar_insert(pagina, "Comprobantes_Emitidos_Paginacion", out)
+
+
+@medido
+def procesar_registros(registros: Registros, index: int, out: SqlWriter) -> str:
+    eNCF = registros.encf
+
+    # Con --batch las sentencias de varios comprobantes quedan mezcladas
+    if out.batch_rows == 1:
+        out.write(comentario_comprobante(index, eNCF))
+
+    procesar_encabezado(registros, out)
+    procesar_forma_pago(registros, eNCF, out)
+    procesar_telefonos_emisor(registros, eNCF, out)
+    procesar_inpuestos_adicionales(registros, eNCF, out)
+    procesar_inpuestos_adicionales_otra_moneda(registros, eNCF, out)
+    procesar_detalle(registros, eNCF, out)
+    procesar_descuento_recargo(registros, eNCF, out)
+    procesar_paginacion(registros, eNCF, out)
+
+    return eNCF
+
+
+def comentario_comprobante(index: int, eNCF: str) -> str:
+    return "-- " + "=" * 80 + f" -- Transaccon {index + 1}, {eNCF=} --\n"
+
+
+def procesar_comprobante(
+    lines: Lines, index: int, out: SqlWriter, schema: Schema, empresa: int
+) -> str:
+    return procesar_registros(despachar(lines, schema, empresa), index, out)
+
+
+class Comprobante(NamedTuple):
+    encf: str
+    registros: list[tuple[str, dict[str, Any]]]
+
+
+# Para usar la herramienta como libreria, sin pasar por res.sql:
+#
+#     for table_name, record in DgiiCasosParser("casos.xlsx", empresa=2):
+#         ...
+#
+# Los registros son los mismos diccionarios (Encabezado, FormaPago, ...) que se
+# escriben como INSERT, en el orden de las llaves foraneas. SqlWriter, BulkWriter
+# y DbWriter son consumidores de esa secuencia, ver escribir()
+class DgiiCasosParser:
+    def __init__(
+        self,
+        source: str | Path | IO,
+        empresa: int = CODIGO_EMPRESA,
+        formato: str | None = None,
+        delimiter: str = "|",
+    ):
+        # Con un archivo abierto el formato sale de su nombre, si lo tiene
+        if formato is None:
+            name = (
+                source
+                if isinstance(source, (str, Path))
+                else getattr(source, "name", "")
+            )
+            formato = extension(str(name)).lstrip(".")
+
+        if formato not in ("csv", "xlsx"):
+            raise ValueError("formato debe ser 'csv' o 'xlsx'")
+
+        self.source = source
+        self.empresa = empresa
+        self.formato = formato
+        self.delimiter = delimiter
+
+    def filas(self) -> Iterator[list[str]]:
+        if self.formato == "xlsx":
+            return load_exel(self.source)
+
+        return read_csv_rows(self.source, delimiter=self.delimiter)
+
+    def comprobantes(self) -> Iterator[Comprobante]:
+        rows = self.filas()
+        header = next(rows, None)
+
+        if header is None:
+            return
+
+        schema = compile_schema(header)
+
+        for row in rows:
+            out = ColectorRegistros()
+            lines = build_lines(schema, row)
+            eNCF = procesar_comprobante(lines, 0, out, schema, self.empresa)
+            yield Comprobante(eNCF, out.registros)
+
+    def __iter__(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        for comprobante in self.comprobantes():
+            yield from comprobante.registros
+
+    def escribir(self, out: SqlWriter) -> int:
+        # Lo mismo que la corrida de linea de comandos con ese writer
+        comprobantes = 0
+
+        with out:
+            out.abrir_transaccion()
+
+            for index, comprobante in enumerate(self.comprobantes()):
+                out.nuevo_comprobante(comprobante.encf)
+
+                if out.batch_rows == 1:
+                    out.write(comentario_comprobante(index, comprobante.encf))
+
+                for table_name, record in comprobante.registros:
+                    out.registro(table_name, record)
+
+                comprobantes += 1
+
+            out.cerrar_transaccion()
+
+        return comprobantes
+
+
+def _iniciar_worker(stats: bool):
+    global STATS, _AVISAR_SUELTAS
+
+    # Ctrl+C llega a todo el grupo; el proceso principal es el que cierra el pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    STATS = Stats() if stats else None
+    _AVISAR_SUELTAS = False
+
+
+def nuevo_pool(jobs: int) -> ProcessPoolExecutor:
+    # No depende del archivo: cada bloque trae su encabezado, asi --watch usa
+    # el mismo pool (y los schemas ya compilados en cada proceso) en cada cambio
+    return ProcessPoolExecutor(
+        max_workers=jobs, initializer=_iniciar_worker, initargs=(STATS is not None,)
+    )
+
+
+def _procesar_bloque(
+    header: tuple[str, ...],
+    bloque: list[tuple[int, list[str]]],
+    empresa: int,
+    batch_rows: int,
+    registros: bool = False,
+):
+    global STATS
+
+    schema = _SCHEMAS.get(header) or compile_schema(list(header))
+    resultados = []
+
+    for index, row in bloque:
+        out = SqlRecorder(batch_rows=batch_rows, registros=registros)
+        lines = build_lines(schema, row)
+        eNCF = procesar_comprobante(lines, index, out, schema, empresa)
+        resultados.append((index, eNCF, out.items))
+
+    # Las estadisticas de cada bloque se suman en el proceso principal
+    stats = None
+
+    if STATS is not None:
+        stats = STATS.as_dict()
+        STATS = Stats()
+
+    return resultados, stats
+
+
+def _resultados_bloque(future) -> list[tuple[int, str, list]]:
+    resultados, stats = future.result()
+
+    if STATS is not None:
+        STATS.merge(stats)
+
+    return resultados
+
+
+def procesar_en_paralelo(
+    rows: Iterator[list[Any]],
+    jobs: int,
+    empresa: int,
+    batch_rows: int,
+    registros: bool = False,
+    executor: ProcessPoolExecutor | None = None,
+):
+    header = next(rows, None)
+
+    if header is None:
+        return
+
+    # Se compila tambien aqui para avisar una sola vez de las columnas sueltas
+    compile_schema(header)
+    header = tuple(header)
+    bloque = []
+    pendientes = deque()
+
+    with contextlib.ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(nuevo_pool(jobs))
+
+        # Se mantienen pocos bloques en vuelo para no leer todo el archivo
+        # por adelantado, y se devuelven en el orden original de las filas
+        for index, row in enumerate(rows):
+            bloque.append((index, row))
+
+            if len(bloque) < JOBS_CHUNK_SIZE:
+                continue
+
+            pendientes.append(
+                executor.submit(
+                    _procesar_bloque, header, bloque, empresa, batch_rows, registros
+                )
+            )
+            bloque = []
+
+            if len(pendientes) >= jobs * 2:
+                yield from _resultados_bloque(pendientes.popleft())
+
+        if bloque:
+            pendientes.append(
+                executor.submit(
+                    _procesar_bloque, header, bloque, empresa, batch_rows, registros
+                )
+            )
+
+        while pendientes:
+            yield from _resultados_bloque(pendientes.popleft())
+
+
+def reportar_stats(args: argparse.Namespace):
+    if STATS is None:
+        return
+
+    if args.stats:
+        STATS.imprimir()
+
+    if args.stats_json:
+        with open(args.stats_json, "w", encoding="utf-8") as f:
+            json.dump(STATS.as_dict(), f, indent=2)
+
+
+def extension(path: str) -> str:
+    # CASOS.XLSX tambien es un .xlsx
+    return Path(path).suffix.lower()
+
+
+def expandir_entradas(entradas: list[str]) -> list[str]:
+    archivos = []
+
+    for entrada in entradas:
+        if Path(entrada).is_dir():
+            candidatos = sorted(str(path) for path in Path(entrada).iterdir())
+        elif glob.has_magic(entrada):
+            candidatos = sorted(glob.glob(entrada, recursive=True))
+        else:
+            archivos.append(entrada)
+            continue
+
+        # Se saltan los ~$archivo.xlsx que deja Excel con el libro abierto
+        archivos.extend(
+            path
+            for path in candidatos
+            if extension(path) in EXTENSIONES_ENTRADA
+            and not Path(path).name.startswith("~$")
+        )
+
+    return archivos
+
+
+def abrir_filas(path_input: str, csv_path: str | None = None) -> Iterator[list[str]]:
+    if extension(path_input) == ".xlsx":
+        print("Loading data from excel file...")
+        rows = load_exel(path_input)
+
+        if csv_path:
+            print("Saving parsed excel file into a csv file\n")
+            rows = save_csv(rows, csv_path)
+
+        return rows
+
+    if extension(path_input) == ".csv":
+        return read_csv_rows(file=path_input, delimiter="|")
+
+    raise ValueError(f"{path_input} no es un archivo .csv o .xlsx")
+
+
+def convertir_archivo(
+    args: argparse.Namespace,
+    path_input: str,
+    destino: Path | None = None,
+    partes: Path | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> tuple[int, list[str]]:
+    # Sin destino se usan los nombres de siempre (res.sql, res.csv, ...); en
+    # modo lote cada archivo escribe <destino>.sql, <destino>.csv, etc. Con
+    # partes el .sql va a ese directorio en vez de junto a los demas
+    if destino is None:
+        sql_path, csv_path, manifest, bulk = (
+            "res.sql",
+            "res.csv",
+            args.manifest,
+            args.bulk,
+        )
+    else:
+        sql_path = f"{Path(partes or destino.parent) / destino.name}.sql"
+        csv_path = f"{destino}.csv"
+        manifest = f"{destino}.manifest.json"
+        bulk = args.bulk and str(Path(args.bulk) / destino.name)
+
+    rows = abrir_filas(path_input, csv_path if args.csv else None)
+
+    # Con --pipeline se lee en un hilo, se convierte en este (o en los procesos
+    # de --jobs) y se escribe en otro, con colas acotadas entre cada etapa
+    if args.pipeline:
+        rows = en_hilo(rows)
+
+    if args.incremental:
+        manifiesto = Manifiesto(manifest)
+
+    if bulk:
+        out = BulkWriter(bulk, buffer_size=args.buffer_size, pipeline=args.pipeline)
+    elif args.dsn:
+        out = DbWriter(
+            args.dsn,
+            batch_rows=args.batch if args.batch > 1 else MAX_BATCH_ROWS,
+            commit_every=args.commit_every,
+        )
+
+        if args.crear_tablas:
+            crear_tablas_sqlite(conectar(args.dsn)[0])
+    else:
+        out = SqlWriter(
+            sql_path,
+            buffer_size=args.buffer_size,
+            batch_rows=args.batch,
+            commit_every=args.commit_every,
+            split_every=args.split_every,
+            split_bytes=int(args.split_mb * (1 << 20)),
+            pipeline=args.pipeline,
+        )
+
+    if args.incremental:
+        rows = filtrar_incremental(rows, manifiesto, out, args.delta, args.empresa)
+
+    comprobantes = 0
+
+    with out:
+        out.abrir_transaccion()
+
+        if args.columnar:
+            for index, registros in enumerate(
+                iter_registros_columnar(rows, args.empresa)
+            ):
+                print(f"Generating ({index + 1}) eNCF={registros.encf!r}")
+                out.nuevo_comprobante(registros.encf)
+                procesar_registros(registros, index, out)
+                comprobantes += 1
+        elif args.jobs > 1:
+            for index, eNCF, items in procesar_en_paralelo(
+                rows,
+                args.jobs,
+                args.empresa,
+                args.batch,
+                registros=bool(bulk or args.dsn),
+                executor=executor,
+            ):
+                print(f"Generating ({index + 1}) {eNCF=}")
+                out.nuevo_comprobante(eNCF)
+                out.replay(items)
+                comprobantes += 1
+        else:
+            header = next(rows, None)
+            schema = compile_schema(header) if header is not None else None
+
+            for index, row in enumerate(rows):
+                lines = build_lines(schema, row)
+                eNCF = get_encf(lines)
+                print(f"Generating ({index + 1}) {eNCF=}")
+                out.nuevo_comprobante(eNCF)
+                procesar_comprobante(lines, index, out, schema, args.empresa)
+                comprobantes += 1
+
+        out.cerrar_transaccion()
+
+    if args.incremental:
+        manifiesto.guardar()
+
+    if args.dsn:
+        return comprobantes, [args.dsn]
+
+    if bulk:
+        return comprobantes, [str(Path(out.path).resolve())]
+
+    return comprobantes, [str(Path(path).resolve()) for path in out.archivos]
+
+
+class ResumenArchivo(NamedTuple):
+    archivo: str
+    comprobantes: int
+    salidas: list[str]
+    segundos: float
+    error: str | None = None
+    stats: dict | None = None
+
+
+def _convertir_en_lote(
+    args: argparse.Namespace,
+    path_input: str,
+    destino: Path,
+    stats: bool,
+    partes: Path | None = None,
+) -> ResumenArchivo:
+    global STATS
+
+    STATS = Stats() if stats else None
+    start = time.perf_counter()
+
+    # Un archivo con error no detiene el lote, se reporta en el resumen
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            comprobantes, salidas = convertir_archivo(args, path_input, destino, partes)
+    except Exception as e:
+        return ResumenArchivo(
+            path_input, 0, [], time.perf_counter() - start, f"{type(e).__name__}: {e}"
+        )
+
+    return ResumenArchivo(
+        path_input,
+        comprobantes,
+        salidas,
+        time.perf_counter() - start,
+        stats=STATS.as_dict() if STATS is not None else None,
+    )
+
+
+def unir_salidas(resumenes: list[ResumenArchivo], path: str):
+    # Cada parte ya es un script completo con su propia transaccion
+    with open(path, "w") as f:
+        for numero, parte in enumerate(
+            parte for resumen in resumenes for parte in resumen.salidas
+        ):
+            if numero:
+                f.write("\nGO\n\n")
+
+            with open(parte) as origen:
+                f.write(f"-- {Path(parte).name}\n")
+                f.writelines(origen)
+
+
+def procesar_lote(args: argparse.Namespace, archivos: list[str]):
+    salida = Path(args.salida or ".")
+    salida.mkdir(parents=True, exist_ok=True)
+
+    # Cada proceso convierte un archivo entero, asi que --jobs reparte archivos
+    args_archivo = argparse.Namespace(
+        **{**vars(args), "jobs": 1, "crear_tablas": False}
+    )
+
+    if args.crear_tablas:
+        crear_tablas_sqlite(conectar(args.dsn)[0])
+
+    print(f"Procesando {len(archivos)} archivos con {args.jobs} procesos...\n")
+
+    resumenes: dict[str, ResumenArchivo] = {}
+
+    # Con --unir los scripts de cada archivo se escriben en un directorio
+    # temporal, asi no se pisa ni se borra nada del directorio de salida
+    partes = tempfile.TemporaryDirectory() if args.unir else None
+
+    with partes or contextlib.nullcontext(), ProcessPoolExecutor(
+        max_workers=args.jobs
+    ) as executor:
+        futures = [
+            executor.submit(
+                _convertir_en_lote,
+                args_archivo,
+                archivo,
+                salida / Path(archivo).stem,
+                STATS is not None,
+                partes and Path(partes.name),
+            )
+            for archivo in archivos
+        ]
+
+        for future in as_completed(futures):
+            resumen = future.result()
+            resumenes[resumen.archivo] = resumen
+
+            if resumen.stats is not None:
+                STATS.merge(resumen.stats)
+
+            if resumen.error:
+                print(f"ERROR {resumen.archivo}: {resumen.error}")
+            else:
+                print(
+                    f"OK    {resumen.archivo}: {resumen.comprobantes} comprobantes "
+                    f"en {resumen.segundos:.2f} s"
+                )
+
+        resumenes_ok = [resumenes[a] for a in archivos if not resumenes[a].error]
+
+        if args.unir:
+            unir_salidas(resumenes_ok, args.unir)
+
+    print(f"\n{'Archivo':<50}{'comprobantes':>13}{'segundos':>10}  resultado")
+
+    for archivo in archivos:
+        resumen = resumenes[archivo]
+        estado = resumen.error or ", ".join(
+            [str(Path(args.unir).resolve())] if args.unir else resumen.salidas
+        )
+        print(
+            f"{archivo:<50}{resumen.comprobantes:>13}{resumen.segundos:>10.2f}  {estado}"
+        )
+
+    fallidos = len(archivos) - len(resumenes_ok)
+    print(f"\nDone! {len(resumenes_ok)} archivos convertidos, {fallidos} con error\n")
+
+    if args.dsn:
+        cerrar_conexiones()
+
+    reportar_stats(args)
+
+    if fallidos:
+        raise SystemExit(1)
+
+
+def firma_archivo(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def regenerar(
+    args: argparse.Namespace,
+    archivo: str,
+    destino: Path | None,
+    executor: ProcessPoolExecutor | None = None,
+):
+    global STATS
+
+    if STATS is not None:
+        STATS = Stats()
+
+    start = time.perf_counter()
+    hora = time.strftime("%H:%M:%S")
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            comprobantes, salidas = convertir_archivo(
+                args, archivo, destino, executor=executor
+            )
+    except Exception as e:
+        print(f"{hora} ERROR {archivo}: {type(e).__name__}: {e}")
+        return
+
+    print(
+        f"{hora} OK    {archivo}: {comprobantes} comprobantes en "
+        f"{time.perf_counter() - start:.2f} s -> {', '.join(salidas)}"
+    )
+    reportar_stats(args)
+
+
+def vigilar(args: argparse.Namespace, lote: bool):
+    # El proceso queda abierto: openpyxl, los schemas, las plantillas de INSERT,
+    # las fechas ya convertidas y las conexiones de --dsn se cargan una sola vez
+    # y cada cambio solo paga la lectura y conversion del archivo
+    salida = Path(args.salida or ".")
+
+    if lote:
+        salida.mkdir(parents=True, exist_ok=True)
+
+    vistos: dict[str, tuple[int, int]] = {}
+    cambiando: dict[str, tuple[int, int]] = {}
+
+    # Con --jobs los procesos tambien quedan abiertos entre regeneraciones
+    executor = nuevo_pool(args.jobs) if args.jobs > 1 and not args.columnar else None
+
+    print(f"Vigilando {', '.join(args.filepath)}, Ctrl+C para salir\n")
+
+    try:
+        while True:
+            # Se vuelve a expandir en cada vuelta para ver archivos nuevos
+            for archivo in expandir_entradas(args.filepath):
+                firma = firma_archivo(archivo)
+
+                if firma is None or firma == vistos.get(archivo):
+                    continue
+
+                # Se espera a que no cambie entre dos vueltas, para no leer un
+                # archivo que todavia se esta guardando
+                if cambiando.get(archivo) != firma:
+                    cambiando[archivo] = firma
+                    continue
+
+                del cambiando[archivo]
+                vistos[archivo] = firma
+                regenerar(
+                    args,
+                    archivo,
+                    salida / Path(archivo).stem if lote else None,
+                    executor,
+                )
+
+            time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        print("\nDone!\n")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+        if args.dsn:
+            cerrar_conexiones()
+
+
+def main():
+    global STATS
+
+    parser = argparse.ArgumentParser(
+        prog="Herramienta de transformacion DGII",
+        description="Transforma archivos csv en sentensias insert en sql de acuerdo a la documentacion de la DGII.",
+    )
+
+    parser.add_argument(
+        "filepath",
+        type=str,
+        nargs="+",
+        help="Archivo .csv o .xlsx. Con varios archivos, un directorio o un patron "
+        "(casos/*.xlsx) se procesan en lote",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--salida",
+        type=str,
+        metavar="DIRECTORIO",
+        help="En lote, directorio donde se escribe <archivo>.sql por cada archivo",
+    )
+
+    parser.add_argument(
+        "--unir",
+        type=str,
+        metavar="ARCHIVO",
+        help="En lote, une los scripts de todos los archivos en uno solo",
+    )
+
+    parser.add_argument("-e", "--empresa", type=int, default=CODIGO_EMPRESA)
+
+    parser.add_argument(
+        "-b",
+        "--buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help="Bytes acumulados en memoria antes de escribir en res.sql",
+    )
+
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="Guarda tambien las filas leidas del xlsx en res.csv para depuracion",
+    )
+
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        help=f"Filas por sentencia INSERT, agrupadas por tabla (max {MAX_BATCH_ROWS})",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Procesos para convertir las filas en paralelo",
+    )
+
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Carga el archivo completo en columnas y lo evalua por columnas "
+        "(usa NumPy si esta instalado)",
+    )
+
+    parser.add_argument(
+        "--layout",
+        action="store_true",
+        help="Muestra las secciones que se encontraron en el encabezado y termina",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Se queda abierto y vuelve a generar la salida cada vez que cambia el "
+        "archivo (o un archivo del directorio o patron)",
+    )
+
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=0.5,
+        metavar="SEGUNDOS",
+        help="Con --watch, cada cuanto se revisan los archivos",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Lee, convierte y escribe en hilos separados, con colas acotadas "
+        "entre cada etapa",
+    )
+
+    parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Cierra la transaccion y abre otra cada N comprobantes",
+    )
+
+    parser.add_argument(
+        "--split-every",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Empieza un archivo res_NNNN.sql nuevo cada N comprobantes",
+    )
+
+    parser.add_argument(
+        "--split-mb",
+        type=float,
+        default=0,
+        metavar="M",
+        help="Empieza un archivo res_NNNN.sql nuevo al pasar M MB",
+    )
+
+    parser.add_argument(
+        "--bulk",
+        type=str,
+        metavar="DIRECTORIO",
+        help="En vez de res.sql escribe un archivo de datos y uno de formato por "
+        "tabla, y cargar.sql para cargarlos con BULK en SQL Server",
+    )
+
+    parser.add_argument(
+        "--dsn",
+        type=str,
+        help="Inserta directo en la base de datos en vez de escribir res.sql: una "
+        "cadena de conexion ODBC (requiere pyodbc) o sqlite:///ruta.db",
+    )
+
+    parser.add_argument(
+        "--crear-tablas",
+        action="store_true",
+        help="Con --dsn sqlite:///, crea las tablas si no existen",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Solo genera los comprobantes nuevos o que cambiaron desde la corrida "
+        "anterior, segun el manifiesto",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="res.manifest.json",
+        help="Manifiesto de --incremental con el hash de cada eNCF",
+    )
+
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Con --incremental, borra antes los registros de los comprobantes que "
+        "cambiaron o ya no estan en el archivo",
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Muestra al final el tiempo por etapa y los registros y bytes por tabla",
+    )
+
+    parser.add_argument(
+        "--stats-json",
+        type=str,
+        help="Guarda las estadisticas de --stats en un archivo JSON",
+    )
+
+    args = parser.parse_args()
+
+    if args.stats or args.stats_json:
+        STATS = Stats()
+
+    entradas = expandir_entradas(args.filepath)
+    lote = (
+        entradas != args.filepath or len(entradas) > 1 or bool(args.salida or args.unir)
+    )
+
+    if lote and not entradas and not args.watch:
+        parser.error("No se encontraron archivos .csv o .xlsx")
+
+    if lote and len({Path(a).stem for a in entradas}) < len(entradas):
+        parser.error("En lote no puede haber dos archivos con el mismo nombre")
+
+    if args.watch and args.unir:
+        parser.error("--unir no se puede combinar con --watch")
+
+    if args.intervalo <= 0:
+        parser.error("--intervalo debe ser mayor que 0")
+
+    if args.unir and (args.bulk or args.dsn):
+        parser.error("--unir no se puede combinar con --bulk o --dsn")
+
+    if args.unir and Path(args.unir).resolve() in {
+        Path(path).resolve()
+        for archivo in entradas
+        for path in (
+            archivo,
+            Path(args.salida or ".") / f"{Path(archivo).stem}.csv",
+            Path(args.salida or ".") / f"{Path(archivo).stem}.manifest.json",
+        )
+    }:
+        parser.error("--unir no puede ser uno de los archivos de entrada o de salida")
+
+    if not lote and args.columnar and args.jobs > 1:
+        parser.error("--columnar no se puede combinar con --jobs")
+
+    if not 1 <= args.batch <= MAX_BATCH_ROWS:
+        parser.error(f"--batch debe estar entre 1 y {MAX_BATCH_ROWS}")
+
+    if args.bulk and args.batch > 1:
+        parser.error("--batch no se puede combinar con --bulk")
+
+    if args.bulk and args.dsn:
+        parser.error("--bulk no se puede combinar con --dsn")
+
+    if min(args.commit_every, args.split_every, args.split_mb) < 0:
+        parser.error(
+            "--commit-every, --split-every y --split-mb no pueden ser negativos"
+        )
+
+    if (args.split_every or args.split_mb) and (args.bulk or args.dsn):
+        parser.error("--split-every y --split-mb solo aplican a res.sql")
+
+    if args.commit_every and args.bulk:
+        parser.error("--commit-every no se puede combinar con --bulk")
+
+    if args.delta and not args.incremental:
+        parser.error("--delta requiere --incremental")
+
+    if args.delta and args.bulk:
+        parser.error("--delta no se puede combinar con --bulk")
+
+    if args.crear_tablas and not (args.dsn or "").startswith("sqlite:///"):
+        parser.error("--crear-tablas solo se puede usar con --dsn sqlite:///")
+
+    if args.layout:
+        for archivo in entradas:
+            header = next(abrir_filas(archivo), None)
+
+            if header is not None:
+                print(f"\n{archivo}")
+                imprimir_layout(compile_schema(header))
+
+        return
+
+    if args.crear_tablas and args.watch:
+        crear_tablas_sqlite(conectar(args.dsn)[0])
+        args.crear_tablas = False
+
+    if args.watch:
+        vigilar(args, lote)
+        return
+
+    if lote:
+        procesar_lote(args, entradas)
+        return
+
+    path_input = entradas[0]
+
+    if not Path(path_input).exists():
+        print("ERROR: El archivo no existe.")
+        return
+
+    if extension(path_input) not in EXTENSIONES_ENTRADA:
+        print("ERROR: El archivo no es un archivo .csv o .xlsx")
+        return
+
+    _, salidas = convertir_archivo(args, path_input)
+
+    print("Done!\n")
+
+    if args.dsn:
+        cerrar_conexiones()
+
+    for salida in salidas:
+        print(f"Result saved at: {salida}")
 
-    print(f"Result saved at: {Path("res.sql").resolve()}")
+    reportar_stats(args)
 
 
 if __name__ == "__main__":